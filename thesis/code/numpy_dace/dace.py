@@ -79,34 +79,35 @@ def pred_error(X,Y,P,Q,verbose=False):
 ## and returns a dist_funcance function for input vectors
 def dist_func(P, Q):
     def dist(x1, x2):
-        diff = [ abs( x1[i] - x2[i] ) for i in range( len(x1) ) ]
-        return sum( [ Q[i] * (diff[i] ** P[i]) for i in range( len(Q) ) ] )
+        diff = np.abs( np.asarray(x1, dtype=float) - np.asarray(x2, dtype=float) )
+        return np.dot( Q, diff ** np.asarray(P, dtype=float) )
     return dist
     
 ## Jones Eq(2)--takes vectors of regression terms, returns a
 ## correlation function between input vectors
+## (P are the exponents and Q the weights, same as in corr_matrix)
 def corr_func(P, Q):
-    dist = dist_func(Q,P)
+    dist = dist_func(P, Q)
     def corr(x1, x2):
         return exp(-dist(x1, x2))
     return corr
     
 ## Returns R, a matrix whose i,jth entry is the correlation between
-## x_i and x_j. First makes a 2d list, then transforms it to a numpy matrix
-## according to stackexchange: http://stackoverflow.com/questions/7133885/fastest-way-to-grow-a-numpy-numeric-array
-## it's fastest to construct with python lists
+## x_i and x_j. This is the same broadcasting kernel as smbo.kernels.corr_matrix:
+## |x_i - x_j| is computed for the i<j pairs only, as one (n(n-1)/2, k) array,
+## weighted and exponentiated in one pass, then mirrored about the unit diagonal
 def corr_matrix(X, P, Q):
-    corr = corr_func(P, Q)
-    out_arr = []
-    for i in range(len(X)):
-        this_row = []
-        for j in range(len(X)):
-            ## save time by exploiting diagonal symmetry
-            if   i > j: this_row.append(out_arr[j][i])
-            elif i < j: this_row.append(corr(X[i],X[j]))
-            else: this_row.append(1)
-        out_arr.append(this_row)
-    return np.array(out_arr)
+    X = np.ascontiguousarray(X, dtype=float)
+    if X.ndim == 1: X = X.reshape(len(X), 1)
+    n = len(X)
+    j, i = np.tril_indices(n, -1)
+    diffs = np.abs(X[i] - X[j])
+    pair_corr = np.exp( -np.power(diffs, np.asarray(P, dtype=float)).dot(np.asarray(Q, dtype=float)) )
+    R = np.empty((n, n))
+    R[i, j] = pair_corr
+    R[j, i] = pair_corr
+    R[np.diag_indices(n)] = 1.0
+    return R
 
 ## the best prediction of the mean mu, Jones Eq(5), given the output vect Y
 ## and the correlation matrix R
@@ -1,13 +1,19 @@
 import numpy as np
 from matplotlib import pyplot as plt
 from scipy import linalg as la
-from scipy.optimize import minimize
+from scipy.optimize import minimize, OptimizeResult
 from scipy.optimize import basinhopping
 from scipy.stats import norm
 
 
 import tests
+import instrument
 import smb_optimizer
 import samplers
 import lazyprop
+import kernels
+import journal
+import trust_region
+import sample_store
+import memo
 import models
\ No newline at end of file
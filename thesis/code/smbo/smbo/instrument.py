@@ -0,0 +1,146 @@
+"""
+.. module:: instrument
+   :platform: Unix, Windows
+   :synopsis: Off-by-default counters and wall-clock timers for the hot paths of the models and the
+       optimizer (correlation matrix builds, factorizations, likelihood evaluations, predictions,
+       expected improvement, acquisition, model updates and objective calls), with per-iteration
+       records that can be exported as JSON lines.
+       While disabled, an instrumented call costs one flag check.
+       Sections nest, and each one's time includes that of the sections inside it (an acquisition
+       includes its expected improvement evaluations, for example). Work done in worker processes is
+       not seen, apart from the parent's wall time waiting on it; the evaluations that
+       :meth:`smbo.smb_optimizer.smb_optimizer.take_samples_async` collects are counted but not timed.
+
+.. moduleauthor:: Drew Blount <dblount@reed.edu>
+
+"""
+
+from timeit import default_timer
+import functools
+import json
+
+enabled = False
+# section name -> [count, seconds], since the last reset
+totals = {}
+# the totals at the end of the last iteration, and the per-iteration records since the last reset
+_last = {}
+records = []
+
+
+def enable():
+    """
+    Turns instrumentation on (and clears anything recorded before)
+    """
+    global enabled
+    reset()
+    enabled = True
+
+
+def disable():
+    """
+    Turns instrumentation off; what has been recorded is kept
+    """
+    global enabled
+    enabled = False
+
+
+def reset():
+    """
+    Clears the totals and the per-iteration records
+    """
+    totals.clear()
+    _last.clear()
+    del records[:]
+
+
+def add(name, seconds=0.0, count=1):
+    """
+    Args:
+        name (str): the section
+        seconds (float): wall time spent in it
+        count (int): the number of times it was entered
+    Adds to a section's totals, if instrumentation is enabled
+    """
+    if not enabled:
+        return
+    total = totals.setdefault(name, [0, 0.0])
+    total[0] += count
+    total[1] += seconds
+
+
+class section:
+    """
+    A context manager timing the block it wraps as one (or count) entries of a named section
+    """
+
+    def __init__(self, name, count=1):
+        self.name = name
+        self.count = count
+
+    def __enter__(self):
+        if enabled:
+            self.start = default_timer()
+        return self
+
+    def __exit__(self, *exc_info):
+        if enabled:
+            add(self.name, default_timer() - self.start, self.count)
+        return False
+
+
+def timed(name):
+    """
+    Args:
+        name (str): the section
+    Returns:
+        function: a decorator timing every call of the decorated function as an entry of the section.
+            It keeps the function's name and docstring, so it can sit under :func:`smbo.lazyprop.lazyprop`.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+            start = default_timer()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                add(name, default_timer() - start)
+        return wrapper
+    return decorate
+
+
+def end_iteration(**fields):
+    """
+    Args:
+        fields: anything identifying the iteration, e.g. iteration=3, n=25
+    Returns:
+        dict: the record of the iteration just ended (None if instrumentation is disabled): the fields, and under
+            'sections' the count and seconds of every section entered since the last record
+    """
+    if not enabled:
+        return None
+    sections = {}
+    for name, (count, seconds) in totals.items():
+        last_count, last_seconds = _last.get(name, (0, 0.0))
+        if count > last_count:
+            sections[name] = {'count': count - last_count, 'seconds': seconds - last_seconds}
+        _last[name] = (count, seconds)
+    record = dict(fields)
+    record['sections'] = sections
+    records.append(record)
+    return record
+
+
+def export(fname=None):
+    """
+    Args:
+        fname (str): if given, the records are appended to this file, one JSON object per line
+    Returns:
+        list: the per-iteration records, as made by :func:`end_iteration`
+    """
+    if fname:
+        with open(fname, 'a') as f:
+            for record in records:
+                f.write(json.dumps(record, sort_keys=True) + '\n')
+    return list(records)
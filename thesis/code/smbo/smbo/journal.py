@@ -0,0 +1,103 @@
+"""
+.. module:: journal
+   :platform: Unix, Windows
+   :synopsis: A durable, append-only record of objective function evaluations. Each evaluation
+       is written (and flushed to disk) as one JSON line as soon as it returns, so that an
+       interrupted optimization can be resumed without re-evaluating the objective anywhere.
+
+.. moduleauthor:: Drew Blount <dblount@reed.edu>
+
+"""
+
+import json
+import os
+
+
+class journal:
+    """
+    An append-only file of objective evaluations, keyed by the objective's identifier and the
+    exact input vector
+    """
+
+    def __init__(self, fname):
+        """
+        Args:
+            fname (str): the journal file. It is created if it does not exist; if it does, the
+                evaluations already in it are loaded.
+        """
+        self.fname = fname
+        # (objective_id, x) -> y, and the order in which the keys were recorded
+        self.values = {}
+        self.order = []
+        # whether the file ends mid-line, so the next record must start on a fresh one
+        self.partial_line = False
+        if os.path.exists(fname):
+            with open(fname) as f:
+                for line in f:
+                    self.partial_line = not line.endswith('\n')
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # a line cut short by a crash mid-write; everything before it is intact
+                        continue
+                    self._remember(entry['objective'], entry['x'], entry['y'])
+
+    @staticmethod
+    def key(objective_id, x):
+        """
+        Returns:
+            tuple: the journal key of an evaluation of objective_id at x
+        """
+        return (objective_id, tuple(float(v) for v in x))
+
+    def _remember(self, objective_id, x, y):
+        key = self.key(objective_id, x)
+        if key not in self.values:
+            self.order.append(key)
+        self.values[key] = y
+
+    def get(self, objective_id, x, default=None):
+        """
+        Returns:
+            float: the recorded value of objective_id at x, or default if it has not been evaluated there
+        """
+        return self.values.get(self.key(objective_id, x), default)
+
+    def record(self, objective_id, x, y):
+        """
+        Args:
+            objective_id (str): identifies the objective function
+            x (list): the input vector
+            y (float): the objective value at x
+        Appends the evaluation to the journal file, and forces it to disk before returning
+        """
+        x = [float(v) for v in x]
+        with open(self.fname, 'a') as f:
+            if self.partial_line:
+                f.write('\n')
+                self.partial_line = False
+            f.write(json.dumps({'objective': objective_id, 'x': x, 'y': float(y)}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._remember(objective_id, x, float(y))
+
+    def evaluate(self, objective_func, x, objective_id):
+        """
+        Returns:
+            float: objective_func(x), from the journal if it has been evaluated there before, and
+                otherwise evaluated and recorded
+        """
+        y = self.get(objective_id, x)
+        if y is None:
+            y = objective_func(x)
+            self.record(objective_id, x, y)
+        return y
+
+    def evaluations(self, objective_id):
+        """
+        Returns:
+            tuple: (X, Y), lists of every recorded input vector and value of objective_id, in the order
+                they were recorded
+        """
+        keys = [key for key in self.order if key[0] == objective_id]
+        return ([list(key[1]) for key in keys], [self.values[key] for key in keys])
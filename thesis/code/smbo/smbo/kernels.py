@@ -0,0 +1,137 @@
+"""
+.. module:: kernels
+   :platform: Unix, Windows
+   :synopsis: Array-native construction of the DACE correlation matrix and correlation vectors.
+       Everything here works on contiguous :math:`(n,k)` float arrays, so the :math:`O(n^2k)`
+       pairwise work is done by numpy broadcasting rather than by nested python loops.
+
+.. moduleauthor:: Drew Blount <dblount@reed.edu>
+
+"""
+
+from smbo import np
+
+
+def as_samples(X):
+    """
+    Args:
+        X (list): an :math:`n`-list of :math:`k`-vectors, or an :math:`(n,k)` array
+    Returns:
+        np.array: X as a C-contiguous :math:`(n,k)` float array (no copy if it already is one)
+    """
+    X = np.ascontiguousarray(X, dtype=float)
+    if X.ndim == 1:
+        X = X.reshape(len(X), 1)
+    return X
+
+
+def pair_indices(n):
+    """
+    Args:
+        n (int): the number of sample points
+    Returns:
+        tuple:
+            (i, j): index arrays of the :math:`n(n-1)/2` pairs with :math:`i<j`. Pairs are
+            ordered by :math:`j`, so the pairs gained by appending an :math:`(n+1)^{th}` sample
+            are simply appended to the end.
+    """
+    j, i = np.tril_indices(n, -1)
+    return i, j
+
+
+def abs_diffs(X):
+    """
+    Args:
+        X (np.array): an :math:`(n,k)` array of sample points
+    Returns:
+        np.array: the :math:`(n(n-1)/2, k)` array of per-dimension distances :math:`|x_i-x_j|`
+        over the pairs of :func:`pair_indices`. The diagonal and lower triangle are never
+        computed, as R is symmetric with a unit diagonal.
+    """
+    X = as_samples(X)
+    i, j = pair_indices(len(X))
+    return np.abs(X[i] - X[j])
+
+
+def weighted_dists(diffs, P, Q):
+    """
+    Args:
+        diffs (np.array): an :math:`(\\ldots,k)` array of per-dimension distances
+        P (list): the :math:`k` exponents of the DACE distance
+        Q (list): the :math:`k` weights of the DACE distance
+    Returns:
+        np.array: :math:`\\sum_l Q_l |d_l|^{P_l}` over the last axis of diffs, Jones Eq. 1, in the precision
+        of diffs if they are floats (and in double precision otherwise)
+    """
+    diffs = np.asarray(diffs)
+    dtype = diffs.dtype if diffs.dtype.kind == 'f' else float
+    return np.power(diffs, np.asarray(P, dtype=dtype)).dot(np.asarray(Q, dtype=dtype))
+
+
+def fill_symmetric(n, pair_vals):
+    """
+    Args:
+        n (int): the number of sample points
+        pair_vals (np.array): correlations over the pairs of :func:`pair_indices`
+    Returns:
+        np.array: the symmetric :math:`n\\times n` matrix with unit diagonal built from pair_vals
+    """
+    i, j = pair_indices(n)
+    R = np.empty((n, n))
+    R[i, j] = pair_vals
+    R[j, i] = pair_vals
+    R[np.diag_indices(n)] = 1.0
+    return R
+
+
+def corr_matrix(X, P, Q):
+    """
+    Args:
+        X (np.array): an :math:`(n,k)` array of sample points
+        P (list): the :math:`k` exponents of the DACE distance
+        Q (list): the :math:`k` weights of the DACE distance
+    Returns:
+        np.array: R, the :math:`n\\times n` matrix whose i,jth entry is the correlation between
+        :math:`x_i` and :math:`x_j`, Jones Eq. 2
+    """
+    X = as_samples(X)
+    return corr_from_diffs(len(X), abs_diffs(X), P, Q)
+
+
+def corr_from_diffs(n, diffs, P, Q):
+    """
+    Args:
+        n (int): the number of sample points
+        diffs (np.array): their :func:`abs_diffs`, of any float dtype
+        P (list): the :math:`k` exponents of the DACE distance
+        Q (list): the :math:`k` weights of the DACE distance
+    Returns:
+        np.array: R, as :func:`corr_matrix`, from distances already computed. The power and weighted sum
+        are done in the precision of diffs, and the exponential in place in double precision, since
+        correlations near 1 would lose most of their :math:`1-r` in single precision.
+    """
+    dists = weighted_dists(diffs, P, Q).astype(float, copy=False)
+    np.negative(dists, out=dists)
+    np.exp(dists, out=dists)
+    return fill_symmetric(n, dists)
+
+
+def corr_cross(X, X_new, P, Q):
+    """
+    Args:
+        X (np.array): an :math:`(n,k)` array of sample points
+        X_new (np.array): an :math:`(m,k)` array of points from the domain
+        P (list): the :math:`k` exponents of the DACE distance
+        Q (list): the :math:`k` weights of the DACE distance
+    Returns:
+        np.array: the :math:`m\\times n` matrix whose i,jth entry is the correlation between
+        the :math:`i^{th}` new point and the :math:`j^{th}` sample point; each row is a
+        :meth:`dace.corr_vector`.
+    The distance is accumulated one dimension at a time, so memory stays at :math:`O(mn)`
+    rather than the :math:`O(mnk)` of a full broadcast.
+    """
+    X, X_new = as_samples(X), as_samples(X_new)
+    dist = np.zeros((len(X_new), len(X)))
+    for l in range(X.shape[1]):
+        dist += Q[l] * np.abs(X_new[:, l, None] - X[None, :, l]) ** P[l]
+    return np.exp(-dist)
@@ -14,36 +14,91 @@
              is performed
            + when some relevant parameters are adjusted (e.g., P or Q is modified,
              of another input-output result is added), all the related
-             properties are deleted (the ones which now must be re-evaluated)
+             properties are deleted (the ones which now must be re-evaluated),
+             and only those: each lazyprop may declare what it depends on
     From Mike Boers' response to detly on StackExchange:
     http://stackoverflow.com/questions/3012421/python-lazy-property-decorator
 .. moduleauthor:: Drew Blount <dblount@reed.edu>
 
 """
 
-def lazyprop(fn):
+class lazy_property(property):
+    """
+    The property made by :func:`lazyprop`, which also records the lazyprop's name and what it depends on
+    """
+    pass
+
+def lazyprop(fn=None, depends=None):
     """
     Args:
         fn (function): a function, whose only argument is self, whose output shouldn't
             be computed more than once for a given X,Y pair.
+        depends (tuple): the names of the attributes (e.g. 'X' or 'P') and other lazyprops that fn's output
+            is computed from. A lazyprop that declares none is taken to depend on everything.
+            Used as :code:`@lazyprop(depends=('R',))`.
     Returns:
         function:
             _lazyprop: a function that calls fn the first time it is called, then remembers 
                 that output and returns this remembered value after subsequent calls
     """
+    if fn is None:
+        return lambda fn: lazyprop(fn, depends)
     attr_name = '_lazy_' + fn.__name__
-    @property
     def _lazyprop(self):
         if not hasattr(self, attr_name):
             setattr(self, attr_name, fn(self))
         return getattr(self, attr_name)
-    return _lazyprop
+    prop = lazy_property(_lazyprop, doc=fn.__doc__)
+    prop.name = fn.__name__
+    prop.depends = None if depends is None else tuple(depends)
+    return prop
+
+# class -> {lazyprop name: its dependencies}
+_dependencies = {}
 
-def reset_lps(self):
+def lazyprops(cls):
     """
-    Resets all lazyprops, so that the evaluated function vals are forgotten and must be
-    recomputed from raw data
+    Returns:
+        dict: the name of every lazyprop of cls (including inherited ones), mapped to the names it depends on
+    """
+    if cls not in _dependencies:
+        props = [getattr(cls, name, None) for name in dir(cls)]
+        _dependencies[cls] = dict((prop.name, prop.depends) for prop in props if isinstance(prop, lazy_property))
+    return _dependencies[cls]
+
+def reset_lps(self, *changed):
+    """
+    Args:
+        changed (str): the names of the attributes or lazyprops that have changed. If none are given,
+            everything is taken to have changed.
+    Resets the lazyprops computed, directly or through other lazyprops, from anything that has changed,
+    so that the evaluated function vals are forgotten and must be recomputed from raw data. The rest
+    are kept.
+    """
+    if not changed:
+        lazy_keys = [k for k in self.__dict__ if (k[0:6] == '_lazy_') ]
+        for key in lazy_keys:
+            delattr(self, key)
+        return
+    props = lazyprops(self.__class__)
+    stale = set(changed)
+    grew = True
+    while grew:
+        grew = False
+        for name, depends in props.items():
+            if name not in stale and (depends is None or stale.intersection(depends)):
+                stale.add(name)
+                grew = True
+    for name in stale:
+        if '_lazy_' + name in self.__dict__:
+            delattr(self, '_lazy_' + name)
+
+def set_lp(self, name, value):
+    """
+    Args:
+        name (str): the name of a lazyprop of self
+        value: its new value
+    Stores value as the lazyprop's remembered output, e.g. when it has been updated
+    more cheaply than by recomputing it from raw data
     """
-    lazy_keys = [k for k in self.__dict__ if (k[0:6] == '_lazy_') ]
-    for key in lazy_keys:
-        delattr(self, key)
\ No newline at end of file
+    setattr(self, '_lazy_' + name, value)
@@ -0,0 +1,65 @@
+"""
+.. module:: memo
+   :platform: Unix, Windows
+   :synopsis: A bounded, least-recently-used memo of model evaluations, with hit and miss counters.
+       An :class:`smbo.smb_optimizer.smb_optimizer` can keep one of predictions and expected improvements,
+       keyed by quantized input points, so that the acquisition loop does not redo the same :math:`O(n^2)`
+       work for points it has already visited since the model last changed.
+
+.. moduleauthor:: Drew Blount <dblount@reed.edu>
+
+"""
+
+from collections import OrderedDict
+
+
+class lru_memo:
+    """
+    A dict of at most maxsize entries, which forgets the least recently used entry when full
+    """
+
+    def __init__(self, maxsize):
+        """
+        Args:
+            maxsize (int): the most entries remembered at once
+        """
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, compute):
+        """
+        Args:
+            key: a hashable key
+            compute (function): a function of no arguments giving the value of key, called on a miss
+        Returns:
+            the remembered value of key, or else compute(), which is then remembered
+        """
+        try:
+            value = self.entries.pop(key)
+            self.hits += 1
+        except KeyError:
+            value = compute()
+            self.misses += 1
+            if len(self.entries) >= self.maxsize:
+                self.entries.popitem(last=False)
+        # (re)inserted as the most recently used
+        self.entries[key] = value
+        return value
+
+    def clear(self):
+        """
+        Forgets every entry (but not the counters), e.g. when the model they were computed from changes
+        """
+        self.entries.clear()
+
+    def info(self):
+        """
+        Returns:
+            dict: the hits, misses, current size and maxsize of the memo
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries), 'maxsize': self.maxsize}
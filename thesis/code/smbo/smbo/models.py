@@ -8,7 +8,6 @@
 """
 
 from smbo import (
-    basinhopping,
     la,
     minimize, 
     norm, 
@@ -16,11 +15,15 @@ from smbo import (
     plt, 
 )
 
-from smbo.lazyprop import lazyprop, reset_lps
+from smbo.kernels import abs_diffs, as_samples, corr_cross, corr_from_diffs, pair_indices
+from smbo.lazyprop import lazyprop, reset_lps, set_lp
+from smbo import instrument, samplers
 
 from matplotlib.widgets import Slider
 from operator import add, sub
 from math import exp, pi, sqrt
+from multiprocessing import Pool
+import copy
 
 import logging
 log = logging.getLogger('ego.log')
@@ -33,29 +36,73 @@ class dace:
     
     # nearzero values for Q parameters lead to singular matrices, hence
     eps = 1e-5
+    # the range of the nugget, and the condition number an adaptive nugget keeps R under
+    min_nugget = 1e-10
+    max_nugget = 1.0
+    max_cond = 1e10
     
-    def __init__(self,X,Y):
+    def __init__(self,X,Y,P=None,Q=None,fit=True,starts=1,processes=1,p_mode='free',q_mode='free',nugget='adaptive',diff_dtype=float,pool=None):
         """
         Args:
             X (list): a list of input vectors
             Y (list): a list of observed objective values
+            P (list), Q (list): starting values for the DACE parameters, e.g. those of a previous fit
+                (default 1.5 for each P, and :math:`1/s_l^2` for each Q, :math:`s_l` the spread of the samples)
+            fit (bool): whether P and Q are set to maximize likelihood. If False, the given P and Q are used as they are.
+            starts (int): how many local searches each likelihood maximization runs; see :meth:`max_likelihood`
+            processes (int): how many worker processes those searches are spread over (None for one per cpu)
+            pool (multiprocessing.Pool): if given, the searches of every fit (including refits on update) run on this
+                pool, which the caller keeps open and closes, rather than on one started and joined per fit. It is
+                not copied or pickled along with the model.
+            p_mode (str): 'free' fits a P for every dimension, 'tied' one P shared by all dimensions, and
+                'fixed' holds every P at 2 (the gaussian correlation)
+            q_mode (str): 'free' fits a Q for every dimension, 'tied' one Q shared by all dimensions
+            nugget: the value :math:`\\delta` added to the diagonal of R. A float holds it fixed; 'fit' fits it by
+                likelihood along with P and Q; 'adaptive' starts every new P and Q at a tenth of the last nugget (see
+                :meth:`relax_nugget`) and raises it tenfold, from self.min_nugget, only as far as R needs to factor with
+                a condition number under self.max_cond.
+            diff_dtype: the float dtype the pairwise distances of :code:`diffs` are kept in; np.float32 halves
+                their :math:`O(n^2k)` memory, at the cost of single-precision distances (and so, for very smooth
+                fits, a larger adaptive nugget)
         Returns:
             tuple:
                 (pred_y,pred_err): two functions, each k-to-1, where k is the dimension of the input space, representing the DACE predictor and predicted error at any point in input space.
         """ 
-        self.X=X
-        self.Y=Y
+        # one contiguous (n,k) float array, so correlations can be built by broadcasting
+        self.X = as_samples(X)
+        self.Y = np.asarray(Y, dtype=float)
         # number of dimensions
-        self.k = len(X[0])
+        self.k = self.X.shape[1]
         # number of evaluated points
         self.n = len(X)
+        # the dtype of the per-dimension distances between samples, which do not change with P and Q
+        self.diff_dtype = diff_dtype
+        # multi-start settings for every fit of this model, including refits on update
+        self.starts = starts
+        self.processes = processes
+        self.pool = pool
+        # which of P and Q are fitted, and how many parameters each contributes
+        if p_mode not in ('free', 'tied', 'fixed'):
+            raise ValueError("p_mode must be 'free', 'tied' or 'fixed', not " + repr(p_mode))
+        if q_mode not in ('free', 'tied'):
+            raise ValueError("q_mode must be 'free' or 'tied', not " + repr(q_mode))
+        self.p_mode = p_mode
+        self.q_mode = q_mode
+        # the nugget setting, and delta, its current value
+        if nugget in ('fit', 'adaptive'):
+            self.delta = 1e-6 if nugget == 'fit' else 0.0
+        else:
+            self.delta = float(nugget)
+        self.nugget = nugget
         
         #the stuff under here
         
         # now sets P and Q to maximize likelihood (first, dummy variables)
-        self.P = self.Q = [1.5 for i in range(self.k)]
-        self.max_likelihood()
-        print('P and Q have been set to maximize the likelihood equation.\n\tP = '+str(self.P)+'\n\tQ = '+str(self.Q))
+        self.P = P
+        self.Q = Q
+        if fit:
+            self.max_likelihood()
+            print('P and Q have been set to maximize the likelihood equation.\n\tP = '+str(self.P)+'\n\tQ = '+str(self.Q))
         
     
     # distance in input-space (x1 is an array; an input vector)
@@ -63,11 +110,8 @@ class dace:
         """
         Returns the parameterized distance between two points in input space
         """
-        return np.sum( [ 
-            self.Q[i] * 
-            abs( x1[i] - x2[i] ) ** self.P[i]
-            for i in range( self.k ) 
-        ] )
+        diff = np.abs(np.asarray(x1, dtype=float) - np.asarray(x2, dtype=float))
+        return np.dot(self.Q, diff ** np.asarray(self.P))
 
     # correlation between the function values at two points in input-space
     def corr(self, x1, x2):
@@ -96,12 +140,56 @@ class dace:
         for key in lazy_keys:
             delattr(self, key)
         
-    @lazyprop
+    @lazyprop(depends=('diffs', 'P', 'Q', 'delta'))
+    @instrument.timed('corr_matrix')
     def R(self):
         """
-        R is the n*n matrix whose i,jth entry is the correlation between the i,jth {evaluated inputs
+        R is the n*n matrix whose i,jth entry is the correlation between the i,jth {evaluated inputs,
+        plus the nugget self.delta on its diagonal
+        """
+        R = corr_from_diffs(self.n, self.diffs, self.P, self.Q)
+        if self.delta:
+            R[np.diag_indices(self.n)] += self.delta
+        return R
+        
+    @lazyprop(depends=('X',))
+    def diffs(self):
+        """
+        The :func:`smbo.kernels.abs_diffs` of X, in self.diff_dtype. They are computed once per data set rather
+        than once per P and Q, and extended rather than recomputed when :meth:`update` adds a point.
+        """
+        self._diffs_buffer = abs_diffs(self.X).astype(getattr(self, 'diff_dtype', float))
+        return self._diffs_buffer
+        
+    def extend_diffs(self, x_new):
+        """
+        Args:
+            x_new (np.array): a :math:`(1,k)` array, the point being added to X
+        Returns:
+            np.array: :code:`diffs` with the pairs :math:`(i,n)` of x_new appended (they come last in pair order),
+                as a view of a buffer that at least doubles when full, like a :class:`smbo.sample_store.sample_store`.
+                The new rows are written in place, so adding a point costs :math:`O(nk)` amortized rather than
+                a copy of all :math:`O(n^2k)` distances. The rows of diffs are never written again.
+        """
+        diffs = self.diffs
+        m = len(diffs)
+        buf = getattr(self, '_diffs_buffer', None)
+        if buf is None or len(buf) < m + self.n or not (diffs is buf or diffs.base is buf):
+            capacity = m + self.n if buf is None else max(2 * len(buf), m + self.n)
+            buf = np.empty((capacity, self.k), dtype=diffs.dtype)
+            buf[:m] = diffs
+            self._diffs_buffer = buf
+        buf[m:m + self.n] = np.abs(self.X - x_new)
+        return buf[:m + self.n]
+        
+    @lazyprop(depends=('diffs',))
+    def log_diffs(self):
+        """
+        The log of :code:`diffs`, in double precision, with :code:`-inf` for a zero distance. It does not
+        depend on P and Q, so :meth:`log_conc_likelihood_grad` computes it once per data set.
         """
-        return np.array([[self.corr(self.X[i],self.X[j]) for i in range(self.n)] for j in range(self.n)])
+        with np.errstate(divide='ignore'):
+            return np.log(self.diffs.astype(float, copy=False))
         
     # like a column of R
     def corr_vector(self, x_new):
@@ -112,49 +200,110 @@ class dace:
             list:
                 a vector whose :math:`i^{th}` element is the parameterized correlation between x_new and the :math`i^{th}` sample point
         """
-        return np.array([self.corr(self.X[i],x_new) for i in range(self.n)])
+        return corr_cross(self.X, np.reshape(x_new, (1, self.k)), self.P, self.Q)[0]
         
-    @lazyprop
+    # R is factored once per (P,Q) as R = L L^T; every product with the inverse of R below
+    # is a pair of triangular solves against L. R_inv itself is only formed for the likelihood
+    # gradients, which need its entries, and never to predict
+    @lazyprop(depends=('R',))
+    @instrument.timed('factorization')
+    def R_chol(self):
+        """
+        The lower-triangular Cholesky factor :math:`L` of R, :math:`R = LL^T`. With an adaptive nugget,
+        self.delta (and so R) is raised until R factors with :meth:`cond_estimate` at most self.max_cond.
+        """
+        if self.nugget != 'adaptive':
+            return la.cholesky(self.R, lower=True)
+        while True:
+            try:
+                L = la.cholesky(self.R, lower=True)
+                if self.cond_estimate(L) <= self.max_cond:
+                    return L
+            except la.LinAlgError:
+                pass
+            if self.delta >= self.max_nugget:
+                raise la.LinAlgError('R is singular even with a nugget of ' + str(self.delta))
+            delta = min(max(10 * self.delta, self.min_nugget), self.max_nugget)
+            set_lp(self, 'R', self.R + (delta - self.delta) * np.eye(self.n))
+            self.delta = delta
+    
+    def relax_nugget(self):
+        """
+        With an adaptive nugget, lowers self.delta tenfold (to 0 from self.min_nugget) for new P and Q. The nugget
+        that sufficed for the last parameters is then usually one or two factorizations away, where starting
+        from 0 would take up to :math:`\\log_{10}` (max_nugget/min_nugget) of them on clustered samples, and
+        the nugget, and so the likelihood, moves smoothly between nearby trials.
+        """
+        if self.nugget == 'adaptive':
+            self.delta = self.delta / 10.0 if self.delta > self.min_nugget else 0.0
+    
+    @staticmethod
+    def cond_estimate(L):
+        """
+        Args:
+            L (np.array): a lower-triangular Cholesky factor
+        Returns:
+            float: :math:`(\\max_i L_{ii}/\\min_i L_{ii})^2`, a cheap lower bound on the condition number of :math:`LL^T`
+        """
+        d = np.abs(np.diag(L))
+        return (d.max() / d.min())**2 if d.min() > 0 else np.inf
+        
+    def R_solve(self, b):
+        """
+        Args:
+            b (np.array): an :math:`n`-vector or :math:`n\\times m` matrix
+        Returns:
+            np.array: :math:`R^{-1}b`, by two triangular solves against :code:`R_chol`
+        """
+        return la.cho_solve((self.R_chol, True), b)
+        
+    @lazyprop(depends=('R_chol',))
+    def log_R_det(self):
+        # log|R| from the factor's diagonal, which cannot underflow like la.det(R) does
+        return 2.0 * np.sum(np.log(np.diag(self.R_chol)))
+        
+    @lazyprop(depends=('R_chol',))
     def R_inv(self):
-        return la.inv(self.R)
+        # by cho_solve against the identity, once per (P,Q): log_conc_likelihood_grad needs its pair entries
+        # and log_conc_likelihood_nugget_grad its trace, and neither multiplies by it
+        return self.R_solve(np.eye(self.n))
         
-    @lazyprop
-    def R_det(self,eps=1e-8):
-        #hmmm, this seems like terrible practice, but I can't have R_det == 0 because it is divided by in the likelihoood equation
-        return max(eps,la.det(self.R))
+    @lazyprop(depends=('log_R_det',))
+    def R_det(self):
+        return np.exp(self.log_R_det)
         
-    @lazyprop
+    @lazyprop(depends=('X',))
     def ones(self):
         return np.ones(self.n) 
     
-    # this one is used a bunch
-    @lazyprop
+    # this one is used a bunch (R is symmetric, so this is also R_inv.dot(ones))
+    @lazyprop(depends=('R_chol', 'ones'))
     def ones_R_inv(self):
-        return(self.ones.T.dot(self.R_inv))
+        return self.R_solve(self.ones)
     
-    @lazyprop
+    @lazyprop(depends=('ones_R_inv', 'Y'))
     def ones_R_inv_Y(self):
         return self.ones_R_inv.dot(self.Y)
         
-    @lazyprop
+    @lazyprop(depends=('ones_R_inv',))
     def ones_R_inv_ones(self):
         return self.ones_R_inv.dot(self.ones)
     
     # best predictor of the mean mu, Jones eq 5
-    @lazyprop
+    @lazyprop(depends=('ones_R_inv_Y', 'ones_R_inv_ones'))
     def mu_hat(self):
         return self.ones_R_inv_Y / self.ones_R_inv_ones
         
-    @lazyprop
+    @lazyprop(depends=('Y', 'ones', 'mu_hat'))
     def Y_min_mu(self):
         return self.Y - (self.ones*self.mu_hat)
     
-    @lazyprop
+    @lazyprop(depends=('R_chol', 'Y_min_mu'))
     def R_inv_Y_min_mu(self):
-        return self.R_inv.dot(self.Y_min_mu)    
+        return self.R_solve(self.Y_min_mu)
     
     # Jones eq(6)
-    @lazyprop
+    @lazyprop(depends=('Y_min_mu', 'R_inv_Y_min_mu'))
     def var_hat(self, eps=1e-8):
         #hmmm, this seems like terrible practice, but I can't have var_hat == 0 because it is divided by in the likelihoood equation
         return max(eps, self.Y_min_mu.T.dot(self.R_inv_Y_min_mu) / self.n)
@@ -164,74 +313,360 @@ class dace:
         """
         Args:
             new_P (list): an :math:`n`-vector resetting the :math:`p` parameter of the DACE model
-            new_Q (list): an :math:`n`-vector resetting the :math:`q` or :math:`\theta` parameter of the DACE model
+            new_Q (list): an :math:`n`-vector resetting the :math:`q` or :math:`\\theta` parameter of the DACE model
  
         Returns the statistical likelihood of the current DACE parameters :code:`P' and :code:`Q', given the data :code:`X` and :code:`Y`.
         """
-        if new_P!=None: self.P=new_P
-        if new_Q!=None: self.Q=new_Q
-        if new_P!=None or new_Q!=None: reset_lps(self)
+        return np.exp(self.log_conc_likelihood(new_P, new_Q))
         
-        inv_linear_term = pow(2.0 * pi * self.var_hat, self.n/2.0) * self.R_det ** (0.5)
-        return exp(self.n/2.0)/inv_linear_term
-    
-        
-    def max_likelihood(self, bounds=None, verbose=False):
+    @instrument.timed('likelihood')
+    def log_conc_likelihood(self, new_P=None, new_Q=None):
         """
         Args:
-            bounds(list): the :math:`P\times Q` domain over which likelihood is being maximized, defaults to :math:`(1,2)\times(0,\infty)`
+            new_P (list): an :math:`n`-vector resetting the :math:`p` parameter of the DACE model
+            new_Q (list): an :math:`n`-vector resetting the :math:`q` or :math:`\\theta` parameter of the DACE model
         Returns:
-            optimization_result:
-                res: an object describing the :math:`P` and :math`Q` values that optimize likelihood
-        The evaluation of this function also resets self.P and self.Q to the values indicated by res, i.e.
-        it sets P and Q to maximize the likelihood of the DACE model, thereby fitting the model to the data.
+            float:
+                the log of :meth:`conc_likelihood`, :math:`-\\frac{n}{2}\\log(2\\pi\\hat{\\sigma}^2) - \\frac{1}{2}\\log|R| - \\frac{n}{2}`.
+                Unlike the likelihood itself, this neither under- nor overflows for moderate n. It is
+                :code:`-inf` when R is numerically singular at the given P and Q.
         """
+        if new_P is not None: self.P=new_P
+        if new_Q is not None: self.Q=new_Q
+        if new_P is not None or new_Q is not None:
+            self.relax_nugget()
+            reset_lps(self, 'P', 'Q', 'delta')
         
-        # default parameter range is each p from 1 to 2, each q > 0
-        if not bounds:
-            p_bounds = [(1,2) for _ in range(self.k)]
-            q_bounds = [(self.eps,None) for _ in range(self.k)]
-            bounds = tuple(p_bounds+q_bounds)
+        try:
+            log_R_det = self.log_R_det
+        except la.LinAlgError:
+            return -np.inf
+        return -(self.n/2.0) * (np.log(2.0 * pi * self.var_hat) + 1.0) - 0.5 * log_R_det
         
-        # allows for the case when P and Q are not yet set
-        if not self.P: self.P = [1.5 for i in range(self.n)]
-        if not self.Q: self.Q = [1.5 for i in range(self.n)]
+    @instrument.timed('likelihood_grad')
+    def log_conc_likelihood_grad(self):
+        """
+        Returns:
+            np.array:
+                the :math:`2k`-vector of partial derivatives of :meth:`log_conc_likelihood` with
+                respect to :math:`P` (first half) and :math:`Q` (second half), at the current P and Q.
+        Because :math:`\\hat{\\mu}` and :math:`\\hat{\\sigma}^2` are themselves maximizers, each partial is
+        :math:`\\frac{1}{2}tr(W\\,\\partial R)` with :math:`W = \\alpha\\alpha^T/\\hat{\\sigma}^2 - R^{-1}`,
+        :math:`\\alpha = R^{-1}(Y-\\hat{\\mu})`. R is symmetric with a constant diagonal, so the trace
+        is a sum over the :math:`i<j` pairs only.
+        """
+        i, j = pair_indices(self.n)
+        alpha = self.R_inv_Y_min_mu
+        # w_ij R_ij over the pairs only, as every derivative of R_ij carries a factor of R_ij
+        w = (alpha[i] * alpha[j] / self.var_hat - self.R_inv[i, j]) * self.R[i, j]
         
-        # the function to be minimized. note that P is the first half of z, Q the second
-        def neg_conc(z): 
-            return (-1 * self.conc_likelihood(z[:self.k],z[self.k:]))
+        P, Q = np.asarray(self.P, dtype=float), np.asarray(self.Q, dtype=float)
+        # |d|^P from the cached log|d|, so each trial does no work that depends on X alone
+        log_diffs = self.log_diffs
+        diffs_P = np.exp(P * log_diffs)
+        # d/dP of |d|^P is |d|^P log|d|, which goes to 0 with |d|
+        diffs_P_log = np.multiply(diffs_P, log_diffs, out=np.zeros_like(diffs_P), where=diffs_P > 0)
         
+        # dR_ij/dQ_l = -R_ij |d_l|^P_l ,  dR_ij/dP_l = -R_ij Q_l |d_l|^P_l log|d_l|
+        grad_Q = -w.dot(diffs_P)
+        grad_P = -Q * w.dot(diffs_P_log)
+        return np.concatenate((grad_P, grad_Q))
         
-        def special_neg_conc(z):
-            # a function we wish to globally optimize
-            for i in range(len(z)):
-                s = 100
-                if i < self.n and z[i]<1:
-                    return s*(1-z[i])
-                elif i < self.n and z[i]>2:
-                    return s*(z[i]-2)
-                elif i>= self.n and z[i]<self.eps:
-                    return s*(self.eps-z[i])
-            return neg_conc(z)
+    def log_conc_likelihood_nugget_grad(self):
+        """
+        Returns:
+            float: the partial derivative of :meth:`log_conc_likelihood` with respect to the nugget, at the
+            current parameters: :math:`\\frac{1}{2}tr(W) = \\frac{1}{2}(\\alpha^T\\alpha/\\hat{\\sigma}^2 - tr(R^{-1}))`,
+            as the nugget's derivative of R is the identity.
+        """
+        alpha = self.R_inv_Y_min_mu
+        return 0.5 * (alpha.dot(alpha) / self.var_hat - np.trace(self.R_inv))
         
+    def __getstate__(self):
+        # a pool of worker processes can be neither pickled nor copied; copies fit without it
+        state = self.__dict__.copy()
+        state['pool'] = None
+        return state
         
-        # the minimizer needs an initial coord
-        z0 = self.P + self.Q
+    @instrument.timed('model_fit')
+    def max_likelihood(self, bounds=None, verbose=False, starts=None, processes=None, pool=None):
+        """
+        Args:
+            bounds(list): the :math:`2k` (min,max) tuples of the :math:`P\\times Q` domain over which likelihood is
+                being maximized. Any None is replaced by the matching entry of :meth:`likelihood_bounds`.
+            starts (int): the number of local searches run. The first starts from the current P and Q;
+                the rest from a maximin latin hypercube over the search space. Defaults to self.starts.
+            processes (int): the number of worker processes the searches are spread over; 1 runs them
+                in this process, None uses one per cpu. Defaults to self.processes.
+            pool (multiprocessing.Pool): an open pool to run the searches on, ignoring processes. Defaults to self.pool;
+                if that is None too, a pool of processes workers is started and joined for this fit alone.
+        Returns:
+            likelihood_result:
+                res: the best of the searches; res.x holds the :math:`P` and :math:`Q` values that optimize
+                likelihood, res.fun their negative log-likelihood, res.nfev the evaluations that search took, and
+                res.nugget the fitted nugget (if self.nugget is 'fit')
+        The evaluation of this function also resets self.P and self.Q to the values indicated by res, i.e.
+        it sets P and Q to maximize the likelihood of the DACE model, thereby fitting the model to the data.
+        The log-likelihood is maximized rather than the likelihood itself, using its analytic gradient, over
+        :math:`\\log Q` rather than Q, so that a step means the same relative change at every length scale.
+        Only the parameters that self.p_mode and self.q_mode leave free are searched, along with the log of the
+        nugget if self.nugget is 'fit'.
+        The concentrated likelihood is often multimodal in Q, so several starts guard against a poor local optimum.
+        """
+        if starts is None: starts = self.starts
+        if processes is None: processes = self.processes
+        if pool is None: pool = getattr(self, 'pool', None)
+        
+        defaults = self.likelihood_bounds()
+        if bounds:
+            bounds = [(lo if lo is not None else d_lo, hi if hi is not None else d_hi)
+                      for (lo, hi), (d_lo, d_hi) in zip(bounds, defaults)]
+        else:
+            bounds = defaults
+        z_bounds = self.search_bounds(bounds)
         
-        minimizer_kwargs = {"method": "COBYLA"}
-        #res = basinhopping(special_neg_conc, z0, minimizer_kwargs=minimizer_kwargs,niter=150,T=0.1)        
-        res = minimize(neg_conc, z0, method='L-BFGS-B',bounds=bounds)
-        #res = minimize(neg_conc, z0, method='SLSQP',bounds=bounds)
+        # allows for the case when P and Q are not yet set; Q starts where the whole sample spread is
+        # correlated by about 1/e
+        if self.P is None: self.P = [1.5 for i in range(self.k)]
+        if self.Q is None: self.Q = 1.0 / self.sample_spread()**2
         
-        print('took ' + str(res.nfev) + ' evaluations of likelihood function to set P and Q.')
+        # the minimizer needs initial coords; the current P and Q always make the first
+        z0 = self.pack(self.P, self.Q, self.delta)
+        z0s = [np.clip(z0, [lo for lo, _ in z_bounds], [hi for _, hi in z_bounds])]
+        if starts > 1:
+            z0s.extend(self.likelihood_starts(starts-1, z_bounds))
+        
+        if starts > 1 and (pool is not None or processes != 1):
+            args = [(self.X, self.Y, z0, z_bounds, self.p_mode, self.q_mode, self.nugget, self.diff_dtype) for z0 in z0s]
+            if pool is not None:
+                results = pool.map(_likelihood_search, args)
+            else:
+                pool = Pool(processes)
+                try:
+                    results = pool.map(_likelihood_search, args)
+                finally:
+                    pool.close()
+                    pool.join()
+        else:
+            results = [self.likelihood_search(z0, z_bounds) for z0 in z0s]
+        res = min(results, key=lambda r: r.fun)
+        
+        print('took ' + str(sum(r.nfev for r in results)) + ' evaluations of likelihood function over ' + str(len(results)) + ' start(s) to set P and Q.')
         # now save the output to P and Q, and reset lazyprops
         self.P = res.x[:self.k]
         self.Q = res.x[self.k:]
-        reset_lps(self)        
+        if self.nugget == 'fit':
+            self.delta = res.nugget
+        self.relax_nugget()
+        reset_lps(self, 'P', 'Q', 'delta')
         return res
+    
+    
+    def likelihood_bounds(self):
+        """
+        Returns:
+            list: the default :math:`2k` (min,max) tuples for P then Q. P lies in :math:`(1,2)`. Q is scaled
+            by the spread :math:`s_l` of the samples in each dimension: at its lower bound
+            :math:`Q_l s_l^2 = 10^{-3}`, so the whole sample is almost perfectly correlated, and at its upper
+            bound :math:`Q_l (s_l/n^{1/k})^2 = 10`, so even neighbouring samples are nearly independent.
+        """
+        span = self.sample_spread()
+        spacing = span / float(self.n) ** (1.0 / self.k)
+        q_lo = np.maximum(1e-3 / span**2, self.eps)
+        q_hi = np.maximum(10.0 / spacing**2, 10 * q_lo)
+        return [(1.0, 2.0) for _ in range(self.k)] + list(zip(q_lo, q_hi))
+    
+    
+    def sample_spread(self):
+        """
+        Returns:
+            np.array: the range of the samples in each dimension (1 where they do not vary)
+        """
+        span = self.X.max(axis=0) - self.X.min(axis=0)
+        return np.where(span > 0, span, 1.0)
+    
+    
+    def pack(self, P, Q, delta=None):
+        """
+        Args:
+            P (list), Q (list): :math:`k`-vectors of DACE parameters
+            delta (float): the nugget, used only when it is fitted
+        Returns:
+            np.array: the vector searched by :meth:`likelihood_search`: the free P values, then the logs
+            of the free Q values, then the log of a fitted nugget. Tied parameters appear once, as the (geometric) mean.
+        """
+        P = np.asarray(P, dtype=float)
+        log_Q = np.log(np.maximum(np.asarray(Q, dtype=float), self.eps))
+        z_P = {'free': P, 'tied': P.mean(keepdims=True), 'fixed': P[:0]}[self.p_mode]
+        z_Q = log_Q.mean(keepdims=True) if self.q_mode == 'tied' else log_Q
+        z_delta = [np.log(max(delta, self.min_nugget))] if self.nugget == 'fit' else []
+        return np.concatenate((z_P, z_Q, z_delta))
+    
+    
+    def unpack(self, z):
+        """
+        Args:
+            z (np.array): a vector as made by :meth:`pack`
+        Returns:
+            tuple: (P, Q, delta), the :math:`k`-vectors of DACE parameters z describes, and the nugget (None
+            unless it is fitted)
+        """
+        n_P = self.n_P
+        n_Q = 1 if self.q_mode == 'tied' else self.k
+        if self.p_mode == 'fixed':
+            P = np.full(self.k, 2.0)
+        else:
+            P = np.resize(z[:n_P], self.k)
+        Q = np.resize(np.exp(z[n_P:n_P+n_Q]), self.k)
+        delta = np.exp(z[n_P+n_Q]) if self.nugget == 'fit' else None
+        return P, Q, delta
+    
+    
+    @property
+    def n_P(self):
+        """
+        int: the number of P values in a :meth:`pack` vector
+        """
+        return {'free': self.k, 'tied': 1, 'fixed': 0}[self.p_mode]
+    
+    
+    def search_bounds(self, bounds):
+        """
+        Args:
+            bounds (list): :math:`2k` finite (min,max) tuples for P then Q
+        Returns:
+            list: the matching (min,max) tuples for a :meth:`pack` vector. A tied parameter takes the
+            loosest bounds over all dimensions, and a fitted nugget lies between self.min_nugget and self.max_nugget.
+        """
+        P_bounds, Q_bounds = bounds[:self.k], [(np.log(lo), np.log(hi)) for lo, hi in bounds[self.k:]]
+        def tie(bs):
+            return [(min(lo for lo, _ in bs), max(hi for _, hi in bs))]
+        z_P = {'free': P_bounds, 'tied': tie(P_bounds), 'fixed': []}[self.p_mode]
+        z_Q = tie(Q_bounds) if self.q_mode == 'tied' else Q_bounds
+        z_delta = [(np.log(self.min_nugget), np.log(self.max_nugget))] if self.nugget == 'fit' else []
+        return list(z_P) + list(z_Q) + z_delta
+    
+    
+    def likelihood_starts(self, m, z_bounds):
+        """
+        Args:
+            m (int): the number of starting points
+            z_bounds (list): the (min,max) tuples of :meth:`search_bounds`
+        Returns:
+            np.array: an :math:`m`-row maximin latin hypercube of starting points over z_bounds. As Q is
+            searched in its logarithm, Q is spread evenly over orders of magnitude.
+        """
+        lo, hi = np.array(z_bounds, dtype=float).T
+        return lo + samplers.maximin_latin_hypercube(m, len(z_bounds)) * (hi - lo)
+    
+    
+    def likelihood_search(self, z0, z_bounds):
+        """
+        Args:
+            z0 (np.array): the starting point, a :meth:`pack` vector
+            z_bounds (list): the (min,max) tuples of :meth:`search_bounds`
+        Returns:
+            likelihood_result: a single L-BFGS-B minimization of the negative log-likelihood from z0, with x
+            given as P then Q. The model's own P and Q are left as the last ones tried, so callers reset them.
+        """
+        n_P = self.n_P
+        
+        # the function to be minimized, and its gradient by the chain rule: dl/dlogQ = Q dl/dQ,
+        # and a tied parameter collects the partials of every dimension it stands for
+        def neg_log_conc(z):
+            P, Q, delta = self.unpack(z)
+            if delta is not None: self.delta = delta
+            log_conc = self.log_conc_likelihood(P, Q)
+            if np.isinf(log_conc):
+                # singular R: a huge value with no slope sends the line search back
+                return (1e20, np.zeros(len(z)))
+            grad = self.log_conc_likelihood_grad()
+            grad_P, grad_log_Q = grad[:self.k], Q * grad[self.k:]
+            grad_P = {'free': grad_P, 'tied': grad_P.sum(keepdims=True), 'fixed': grad_P[:0]}[self.p_mode]
+            if self.q_mode == 'tied':
+                grad_log_Q = grad_log_Q.sum(keepdims=True)
+            grad_log_delta = [delta * self.log_conc_likelihood_nugget_grad()] if delta is not None else []
+            return (-log_conc, -np.concatenate((grad_P, grad_log_Q, grad_log_delta)))
+        
+        res = minimize(neg_log_conc, z0, method='L-BFGS-B', jac=True, bounds=z_bounds)
+        # keep only what the caller needs, so results pickle cheaply back from worker processes
+        P, Q, delta = self.unpack(res.x)
+        return likelihood_result(np.concatenate((P, Q)), res.fun, res.nfev, delta)
        
     
+    def update(self, x_new, y_new, refit=False):
+        """
+        Args:
+            x_new (list): a :math:`k`-vector from the domain, to be added to the sample points
+            y_new (float): the observed objective value at x_new
+            refit (bool): whether P and Q are re-fit to maximize likelihood with the new point included
+        Adds one sample point to the model. If refit, the likelihood optimization is warm-started
+        from the current P and Q. Otherwise P and Q are held, and R and its Cholesky factor are
+        extended by one row in :math:`O(n^2)` rather than re-factored in :math:`O(n^3)`.
+        """
+        x_new = as_samples([x_new])
+        if refit or not hasattr(self, '_lazy_R_chol'):
+            R = R_chol = None
+        else:
+            # R = [[R, r], [r.T, 1+delta]] factors as [[L, 0], [l.T, d]], with L l = r and d^2 = 1 + delta - l.l
+            r = self.corr_vector(x_new[0])
+            l = la.solve_triangular(self.R_chol, r, lower=True)
+            d_sq = 1.0 + self.delta - l.dot(l)
+            diag = np.abs(np.diag(self.R_chol))
+            if d_sq > 0 and (self.nugget != 'adaptive' or
+                             (max(diag.max(), sqrt(d_sq)) / min(diag.min(), sqrt(d_sq)))**2 <= self.max_cond):
+                n = self.n
+                R = np.empty((n+1, n+1))
+                R[:n, :n] = self.R
+                R[n, :n] = R[:n, n] = r
+                R[n, n] = 1.0 + self.delta
+                R_chol = np.zeros((n+1, n+1))
+                R_chol[:n, :n] = self.R_chol
+                R_chol[n, :n] = l
+                R_chol[n, n] = np.sqrt(d_sq)
+            else:
+                # x_new is numerically a copy of a sample point; fall back to a fresh factorization
+                # (which raises an adaptive nugget as far as it needs to)
+                R = R_chol = None
+        
+        diffs = self.extend_diffs(x_new) if hasattr(self, '_lazy_diffs') else None
+        self.X = np.vstack((self.X, x_new))
+        self.Y = np.append(self.Y, float(y_new))
+        self.n += 1
+        reset_lps(self, 'X', 'Y')
+        if diffs is not None:
+            set_lp(self, 'diffs', diffs)
+        if refit:
+            self.max_likelihood()
+        elif R_chol is not None:
+            set_lp(self, 'R', R)
+            set_lp(self, 'R_chol', R_chol)
+       
+    def rescore(self, Y):
+        """
+        Args:
+            Y (list): new objective values for the same sample points X, e.g. corrected or re-evaluated ones
+        Replaces Y, keeping P and Q and everything computed from X alone, including the factorization of R.
+        """
+        self.Y = np.asarray(Y, dtype=float)
+        reset_lps(self, 'Y')
+       
+    def compact(self):
+        """
+        Returns:
+            dace: a shallow copy of this model that remembers only its Cholesky factor among the lazily
+                computed properties, which is what is worth saving in a checkpoint (the pairwise distances
+                are cheap to recompute, and large)
+        """
+        other = copy.copy(self)
+        reset_lps(other)
+        other.__dict__.pop('_diffs_buffer', None)
+        if hasattr(self, '_lazy_R_chol'):
+            set_lp(other, 'R_chol', self.R_chol)
+        return other
+       
     # the 
+    @instrument.timed('prediction')
     def predict(self, x_new):
         """
         Args:
@@ -254,21 +689,101 @@ class dace:
                 the predicted function value at x_new
         This is computed using the so-called best linear unbiased predictor,  Jones Eq. 7. Variables such as the correlation matrix :math:'\mathbb{R}' are saved as they are copmuted lazily by this and other methods.
         """
+        return self.pred_stats(x_new)[1]
+        
+    # batched versions of predict and pred_err: one cross-correlation matrix for all the
+    # points, and matrix-level solves in place of one matvec per point
+    @instrument.timed('prediction')
+    def predict_many(self, X_new):
+        """
+        Args:
+            X_new (np.array): an :math:`(m,k)` array of points from the domain
+        Returns:
+            np.array: the :math:`m` predicted function values, as :meth:`predict` at each point
+        """
+        r = corr_cross(self.X, X_new, self.P, self.Q)
+        return self.mu_hat + r.dot(self.R_inv_Y_min_mu)
+        
+    def pred_err_many(self, X_new):
+        """
+        Args:
+            X_new (np.array): an :math:`(m,k)` array of points from the domain
+        Returns:
+            np.array: the :math:`m` predicted errors, as :meth:`pred_err` at each point
+        """
+        return self.pred_stats_many(X_new)[1]
+        
+    # fused versions: the prediction and its error share one correlation vector (or matrix)
+    @instrument.timed('prediction')
+    def pred_stats(self, x_new):
+        """
+        Args:
+            x_new (list): a :math:`k`-vector from the domain
+        Returns:
+            tuple:
+                (y, err): :meth:`predict` and :meth:`pred_err` at x_new, computed from a single correlation vector
+        """
         r = self.corr_vector(x_new)
-        R_inv_r = self.R_inv.dot(r)
+        # r.T R_inv r == v.v for v = L_inv r, so one triangular solve is enough
+        v = la.solve_triangular(self.R_chol, r, lower=True)
+        y = self.mu_hat + r.dot(self.R_inv_Y_min_mu)
+        err = self.var_hat * (1 - v.dot(v) + (1 - self.ones_R_inv.dot(r))**2 / self.ones_R_inv_ones)
         # was getting some weird tiny (magnitude) negative number float errors
-        out = self.var_hat * (1 - r.dot(R_inv_r) + ( ( 1 - self.ones.dot( R_inv_r) )**2 / (self.ones_R_inv_ones)) )
-        return (max(out, 0.0))
+        return (y, max(err, 0.0))
+        
+    @instrument.timed('prediction')
+    def pred_stats_many(self, X_new):
+        """
+        Args:
+            X_new (np.array): an :math:`(m,k)` array of points from the domain
+        Returns:
+            tuple:
+                (ys, errs): :meth:`predict_many` and :meth:`pred_err_many` at X_new, computed from a single cross-correlation matrix
+        """
+        r = corr_cross(self.X, X_new, self.P, self.Q)
+        V = la.solve_triangular(self.R_chol, r.T, lower=True)
+        ys = self.mu_hat + r.dot(self.R_inv_Y_min_mu)
+        errs = self.var_hat * (1 - np.sum(V * V, axis=0) + (1 - r.dot(self.ones_R_inv))**2 / self.ones_R_inv_ones)
+        return (ys, np.maximum(errs, 0.0))
+        
+    @instrument.timed('prediction')
+    def pred_stats_grad(self, x_new):
+        """
+        Args:
+            x_new (list): a :math:`k`-vector from the domain
+        Returns:
+            tuple:
+                (y, err, y_grad, err_grad): :meth:`pred_stats` at x_new, followed by the gradients
+                (:math:`k`-vectors) of the prediction and of its error with respect to x_new
+        """
+        x_new = np.asarray(x_new, dtype=float)
+        r = self.corr_vector(x_new)
+        diffs = x_new - self.X
+        P, Q = np.asarray(self.P, dtype=float), np.asarray(self.Q, dtype=float)
+        # J[i,l] = dr_i/dx_l = -r_i Q_l P_l |d_il|^(P_l-1) sign(d_il)
+        J = -r[:, None] * Q * P * np.abs(diffs) ** (P - 1) * np.sign(diffs)
+        
+        R_inv_r = self.R_solve(r)
+        ones_R_inv_r = 1 - self.ones_R_inv.dot(r)
+        y = self.mu_hat + r.dot(self.R_inv_Y_min_mu)
+        err = self.var_hat * (1 - r.dot(R_inv_r) + ones_R_inv_r**2 / self.ones_R_inv_ones)
+        
+        y_grad = J.T.dot(self.R_inv_Y_min_mu)
+        if err <= 0.0:
+            # clamped to 0 (x_new is a sample point), where the error is flat
+            return (y, 0.0, y_grad, np.zeros(self.k))
+        err_grad = -2 * self.var_hat * J.T.dot(R_inv_r + ones_R_inv_r * self.ones_R_inv / self.ones_R_inv_ones)
+        return (y, err, y_grad, err_grad)
         
       
     # what follows below are the components required to maximize the expected improvement
     # function (Jones Eq. 15)  
-    @lazyprop
+    @lazyprop(depends=('var_hat',))
     def stdev(self):
         return sqrt(self.var_hat)
         
     # current minimum function value (assume optimization problem is minimization)
-    @lazyprop
+    @lazyprop(depends=('Y',))
     def f_min(self):
         """
         Args:
@@ -287,18 +802,11 @@ class dace:
             float:
                 the predicted benefit in f_min of sampling the objective function at x_new
         """
-        # should predict(x) be stored lazily? don't want to double-call the predictor function
-        # (maybe unnecessary; is the predictor function ever explicitly used in the iterative process?)
-        y = self.predict(x_new)
+        y, err = self.pred_stats(x_new)
         # improvement over current minimum
         improvement = self.f_min - y
         
-        # s
-        err = self.pred_err(x_new)
-        if (err < 0):
-            print('Error: pred_err(x) < 0 for x = ' + str(x_new) + '; pred_err(x) = ' + str(err))
-        
-        st_dev = sqrt(self.pred_err(x_new))
+        st_dev = sqrt(err)
         
         # catches when x_new is in X (already evaluated points, 100% certain of prediction)
         if (st_dev == 0.0): return(0.0)
@@ -306,16 +814,294 @@ class dace:
         normed_improvement = improvement/st_dev
         return(improvement * norm.cdf(normed_improvement) + st_dev * norm.pdf(normed_improvement))
         
-def dace_function(X,Y):
+def dace_function(X,Y,**kwargs):
     """
     Args:
         X (list): a list of input vectors
         Y (list): a list of observed objective values
+        kwargs: passed on to :class:`dace`, e.g. starts and processes for multi-start fitting
     Returns:
         tuple:
             (pred_y,pred_err): two functions, each k-to-1, where k is the dimension of the input space, representing the dace predictor surface and predicted error at each point in input space
     This instantiates a dace class member behind the scenes and returns its predictor function, and the predicted error function of its predictor function.
     """
-    dacer = dace(X,Y)
+    dacer = dace(X,Y,**kwargs)
     return (dacer.predict, dacer.pred_err)
-    
\ No newline at end of file
+
+
+class sparse_dace:
+    """
+    An approximate DACE model for large sample sets, built on :math:`m \\ll n` inducing points with the
+    FITC (fully independent training conditional) approximation. Fitting and prediction cost :math:`O(nm^2)`
+    time and :math:`O(nm)` memory, where the exact :class:`dace` takes :math:`O(n^3)` and :math:`O(n^2)`.
+    """
+    
+    # the least variance left to any one sample once the inducing points have explained what they can
+    min_lambda = 1e-6
+    
+    def __init__(self,X,Y,m=200,P=None,Q=None,fit=True,**kwargs):
+        """
+        Args:
+            X (list): a list of input vectors
+            Y (list): a list of observed objective values
+            m (int): the number of inducing points (all of the samples, if there are no more than m)
+            P (list), Q (list): starting values for the DACE parameters; required if fit is False
+            fit (bool): whether P and Q are set to maximize the likelihood of an exact :class:`dace` model of the
+                inducing points alone
+            kwargs: passed on to that :class:`dace` model, e.g. starts, p_mode, nugget or pool
+        """
+        self.X = as_samples(X)
+        self.Y = np.asarray(Y, dtype=float)
+        self.k = self.X.shape[1]
+        self.n = len(self.X)
+        self.m = m
+        self.P = P
+        self.Q = Q
+        self.model_kwargs = kwargs
+        self.fit_inducing(fit)
+        
+    def fit_inducing(self, fit=True):
+        """
+        Args:
+            fit (bool): whether the DACE parameters are re-fit, warm-started from the current ones
+        Chooses the inducing points by :func:`farthest_points`, and builds the exact model of them whose
+        parameters (and nugget) the approximation shares.
+        """
+        self.inducing = farthest_points(self.X, self.Y, min(self.m, self.n))
+        self.Z = self.X[self.inducing]
+        self.exact = dace(self.Z, self.Y[self.inducing], self.P, self.Q, fit=fit, **self.model_kwargs)
+        self.P, self.Q = self.exact.P, self.exact.Q
+        reset_lps(self)
+        
+    def __getstate__(self):
+        # as for dace, the pool (if any) stays behind
+        state = self.__dict__.copy()
+        if 'pool' in self.model_kwargs:
+            state['model_kwargs'] = dict(self.model_kwargs, pool=None)
+        return state
+    
+    # with K the correlations of the inducing points (factored as L L^T by the exact model) and
+    # V = L_inv K_mn, the FITC covariance of the samples is C = V^T V + Lambda, Lambda diagonal.
+    # Every solve against C goes through A = I + V Lambda_inv V^T, which is only m*m
+    @lazyprop
+    def V(self):
+        return la.solve_triangular(self.exact.R_chol, corr_cross(self.Z, self.X, self.P, self.Q).T, lower=True)
+    
+    @lazyprop
+    def Lambda(self):
+        # the diagonal of R that the inducing points cannot explain
+        return np.maximum(1.0 + self.exact.delta - np.sum(self.V * self.V, axis=0), self.min_lambda)
+    
+    @lazyprop
+    @instrument.timed('factorization')
+    def A_chol(self):
+        return la.cholesky(np.eye(len(self.Z)) + (self.V / self.Lambda).dot(self.V.T), lower=True)
+    
+    def A_solve(self, b):
+        """
+        Args:
+            b (np.array): an :math:`m`-vector or :math:`m\\times l` matrix
+        Returns:
+            np.array: :math:`A^{-1}b`
+        """
+        return la.cho_solve((self.A_chol, True), b)
+    
+    def C_quad(self, a, b):
+        """
+        Args:
+            a (np.array), b (np.array): :math:`n`-vectors
+        Returns:
+            float: :math:`a^TC^{-1}b`, by the Woodbury identity
+        """
+        Va, Vb = self.V.dot(a / self.Lambda), self.V.dot(b / self.Lambda)
+        return a.dot(b / self.Lambda) - Va.dot(self.A_solve(Vb))
+    
+    @lazyprop
+    def ones(self):
+        return np.ones(self.n)
+    
+    @lazyprop
+    def ones_C_inv_ones(self):
+        return self.C_quad(self.ones, self.ones)
+    
+    # generalized least squares mean, as Jones eq 5 with C in place of R
+    @lazyprop
+    def mu_hat(self):
+        return self.C_quad(self.ones, self.Y) / self.ones_C_inv_ones
+    
+    @lazyprop
+    def Y_min_mu(self):
+        return self.Y - self.mu_hat
+    
+    # as Jones eq 6
+    @lazyprop
+    def var_hat(self, eps=1e-8):
+        return max(eps, self.C_quad(self.Y_min_mu, self.Y_min_mu) / self.n)
+    
+    # the predictor is mu_hat + v.weights, with v = L_inv r for r the correlations with the inducing points
+    @lazyprop
+    def weights(self):
+        return self.A_solve(self.V.dot(self.Y_min_mu / self.Lambda))
+    
+    # V C_inv 1, which carries the uncertainty in mu_hat into the predicted error
+    @lazyprop
+    def ones_weights(self):
+        return self.A_solve(self.V.dot(1.0 / self.Lambda))
+    
+    @lazyprop
+    def f_min(self):
+        return np.min(self.Y)
+    
+    @instrument.timed('prediction')
+    def pred_stats_many(self, X_new):
+        """
+        Args:
+            X_new (np.array): an :math:`(l,k)` array of points from the domain
+        Returns:
+            tuple:
+                (ys, errs): the :math:`l` predicted function values and their predicted errors
+        """
+        r = corr_cross(self.Z, X_new, self.P, self.Q)
+        v = la.solve_triangular(self.exact.R_chol, r.T, lower=True)
+        w = la.solve_triangular(self.A_chol, v, lower=True)
+        ys = self.mu_hat + self.weights.dot(v)
+        errs = self.var_hat * (1 - np.sum(v * v, axis=0) + np.sum(w * w, axis=0) + (1 - self.ones_weights.dot(v))**2 / self.ones_C_inv_ones)
+        return (ys, np.maximum(errs, 0.0))
+    
+    def pred_stats(self, x_new):
+        """
+        Args:
+            x_new (list): a :math:`k`-vector from the domain
+        Returns:
+            tuple:
+                (y, err): :meth:`predict` and :meth:`pred_err` at x_new
+        """
+        ys, errs = self.pred_stats_many(np.reshape(x_new, (1, self.k)))
+        return (ys[0], errs[0])
+    
+    def predict(self, x_new):
+        """
+        Args:
+            x_new (list): a :math:`k`-vector from the domain
+        Returns:
+            float: the predicted function value at x_new
+        """
+        return self.pred_stats(x_new)[0]
+    
+    def pred_err(self, x_new):
+        """
+        Args:
+            x_new (list): a :math:`k`-vector from the domain
+        Returns:
+            float: the predicted error (variance) of the prediction at x_new
+        """
+        return self.pred_stats(x_new)[1]
+    
+    def predict_many(self, X_new):
+        """
+        Args:
+            X_new (np.array): an :math:`(l,k)` array of points from the domain
+        Returns:
+            np.array: the :math:`l` predicted function values
+        """
+        return self.pred_stats_many(X_new)[0]
+    
+    def pred_err_many(self, X_new):
+        """
+        Args:
+            X_new (np.array): an :math:`(l,k)` array of points from the domain
+        Returns:
+            np.array: the :math:`l` predicted errors
+        """
+        return self.pred_stats_many(X_new)[1]
+    
+    def update(self, x_new, y_new, refit=False):
+        """
+        Args:
+            x_new (list): a :math:`k`-vector from the domain, to be added to the sample points
+            y_new (float): the observed objective value at x_new
+            refit (bool): whether the inducing points are chosen again and the DACE parameters re-fit
+        Adds one sample point to the model. Otherwise the inducing points and parameters are held, and
+        only the :math:`O(nm^2)` approximation is redone.
+        """
+        self.X = np.vstack((self.X, as_samples([x_new])))
+        self.Y = np.append(self.Y, float(y_new))
+        self.n += 1
+        if refit:
+            self.fit_inducing(fit=True)
+        else:
+            reset_lps(self)
+    
+    def compact(self):
+        """
+        Returns:
+            sparse_dace: a shallow copy of this model without its lazily computed properties, for checkpoints
+        """
+        other = copy.copy(self)
+        reset_lps(other)
+        other.exact = self.exact.compact()
+        return other
+
+
+def sparse_dace_function(X,Y,**kwargs):
+    """
+    Args:
+        X (list): a list of input vectors
+        Y (list): a list of observed objective values
+        kwargs: passed on to :class:`sparse_dace`, e.g. m, the number of inducing points
+    Returns:
+        tuple:
+            (pred_y,pred_err): the predictor and predicted error functions of a :class:`sparse_dace` model, for
+            use as an :class:`smb_optimizer` modeller in place of :func:`dace_function`
+    """
+    model = sparse_dace(X,Y,**kwargs)
+    return (model.predict, model.pred_err)
+
+
+def farthest_points(X, Y, m):
+    """
+    Args:
+        X (np.array): an :math:`(n,k)` array of sample points
+        Y (np.array): their observed objective values
+        m (int): the number of points to choose
+    Returns:
+        np.array: the indices of m of the points, chosen greedily: first the best sample, then again and
+        again the sample farthest from all those already chosen. Distances are measured with each
+        dimension scaled by the spread of the samples in it.
+    """
+    X = as_samples(X)
+    span = X.max(axis=0) - X.min(axis=0)
+    X = X / np.where(span > 0, span, 1.0)
+    chosen = [int(np.argmin(Y))]
+    dists = np.sum((X - X[chosen[0]])**2, axis=1)
+    for _ in range(m - 1):
+        i = int(np.argmax(dists))
+        chosen.append(i)
+        dists = np.minimum(dists, np.sum((X - X[i])**2, axis=1))
+    return np.array(chosen)
+
+
+class likelihood_result:
+    """
+    The outcome of one local likelihood search: the optimal (P,Q) vector x, the negative
+    log-likelihood fun there, nfev, the number of likelihood evaluations it took, and the
+    fitted nugget (None unless it was fitted)
+    """
+    def __init__(self, x, fun, nfev, nugget=None):
+        self.x = np.asarray(x)
+        self.fun = float(fun)
+        self.nfev = nfev
+        self.nugget = nugget
+
+
+def _likelihood_search(args):
+    """
+    Args:
+        args (tuple): (X, Y, z0, z_bounds, p_mode, q_mode, nugget, diff_dtype)
+    Returns:
+        likelihood_result: one local search from z0 on an unfitted model of (X,Y); module-level
+        so that worker processes can run it
+    """
+    X, Y, z0, z_bounds, p_mode, q_mode, nugget, diff_dtype = args
+    model = dace(X, Y, fit=False, p_mode=p_mode, q_mode=q_mode, nugget=nugget, diff_dtype=diff_dtype)
+    return model.likelihood_search(z0, z_bounds)
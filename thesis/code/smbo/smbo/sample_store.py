@@ -0,0 +1,97 @@
+"""
+.. module:: sample_store
+   :platform: Unix, Windows
+   :synopsis: A growable, contiguous store of sample points and their objective values. Appending is
+       amortized :math:`O(1)`, as the underlying arrays grow geometrically, and readers are handed
+       read-only views rather than copies.
+
+.. moduleauthor:: Drew Blount <dblount@reed.edu>
+
+"""
+
+from smbo import np
+
+
+class sample_store:
+    """
+    The sample points X, an :math:`(n,k)` float array, and their values Y, an :math:`n` float array, kept
+    at the front of preallocated :math:`(capacity,k)` and :math:`capacity` arrays
+    """
+
+    def __init__(self, k, X=None, Y=None, capacity=16):
+        """
+        Args:
+            k (int): the dimension of input space
+            X (list), Y (list): initial sample points and their values, if any
+            capacity (int): the number of samples room is made for at first
+        """
+        self.k = k
+        self.n = 0
+        self._X = np.empty((capacity, k))
+        self._Y = np.empty(capacity)
+        if X is not None and len(X):
+            self.extend(X, Y)
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def capacity(self):
+        """
+        int: the number of samples the store can hold before it next grows
+        """
+        return len(self._Y)
+
+    @property
+    def X(self):
+        """
+        np.array: a read-only :math:`(n,k)` view of the sample points
+        """
+        view = self._X[:self.n]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def Y(self):
+        """
+        np.array: a read-only :math:`n` view of the objective values
+        """
+        view = self._Y[:self.n]
+        view.flags.writeable = False
+        return view
+
+    def extend(self, X_new, Y_new):
+        """
+        Args:
+            X_new (list): new sample points
+            Y_new (list): their objective values
+        Appends the samples, at least doubling the capacity if they do not fit. Views handed out
+        earlier stay valid, as the first n rows are never written again.
+        """
+        X_new = np.reshape(np.asarray(X_new, dtype=float), (-1, self.k))
+        Y_new = np.reshape(np.asarray(Y_new, dtype=float), -1)
+        m = len(X_new)
+        if self.n + m > self.capacity:
+            capacity = max(2 * self.capacity, self.n + m)
+            X, Y = np.empty((capacity, self.k)), np.empty(capacity)
+            X[:self.n], Y[:self.n] = self._X[:self.n], self._Y[:self.n]
+            self._X, self._Y = X, Y
+        self._X[self.n:self.n + m] = X_new
+        self._Y[self.n:self.n + m] = Y_new
+        self.n += m
+
+    def copy(self):
+        """
+        Returns:
+            sample_store: an independent store holding the same samples, with the same capacity
+        """
+        other = sample_store(self.k, capacity=self.capacity)
+        other.extend(self.X, self.Y)
+        return other
+
+    def __getstate__(self):
+        # only the samples themselves are worth pickling, not the spare capacity
+        return {'k': self.k, 'X': self.X.copy(), 'Y': self.Y.copy()}
+
+    def __setstate__(self, state):
+        self.__init__(state['k'], state['X'], state['Y'], capacity=max(16, len(state['Y'])))
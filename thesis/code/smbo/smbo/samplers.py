@@ -1,66 +1,245 @@
 """
 .. module:: samplers
    :platform: Unix, Windows
-   :synopsis: A module used to select initial sample points from a latin hypercube sample of the input domain
+   :synopsis: A module used to select initial sample points from a (random or maximin) latin hypercube sample, or a sobol or halton sequence, over the input domain
 
 .. moduleauthor:: Drew Blount <dblount@reed.edu>
 
 """
-import smbo, random
+from smbo import np
+import random
+
+
+def random_state(seed=None):
+    """
+    Args:
+        seed: an int seed, an existing numpy RandomState or Generator (used as it is), or None
+    Returns:
+        the random number generator a sampler should draw from. None gives numpy's global
+        generator, so that np.random.seed (and checkpointed generator states) govern it.
+    """
+    if seed is None:
+        return np.random
+    if hasattr(seed, 'uniform') and hasattr(seed, 'permutation'):
+        return seed
+    return np.random.RandomState(seed)
 
 
 ## returns an m-array of k-arrays, describing a k-dimensional latin hypercube of m divisions.
 ## the arrangement of all the 1s  (or 2s, etc) on a full sudoku board is a special case of a (9,2) latin hypercube.
-def latin_hypercube(m, k, bounds=None, rand_sampler=random.random):
+def latin_hypercube(m, k, bounds=None, rand_sampler=None, seed=None):
     """
     Args:
         m (int): the number of desired sample points
         k (int): the dimension of input space
         bounds (list): the :math:`k` min-max tuples describing the function domain as a :math:`k`-rectangle. Defaults to the unit :math:`k`-cube.
-        rand_sampler (function): used to choose actual sample coordinates once the latin hypercube selects a sample's particular hyper(sub)rectangle in the input domain.
+        rand_sampler (function): if given, a function of no arguments used to choose actual sample coordinates once the latin hypercube selects a sample's particular hyper(sub)rectangle in the input domain. Defaults to uniform draws from the seeded generator.
+        seed: an int, a numpy RandomState or Generator, or None (numpy's global generator); see :func:`random_state`
             
     Returns:
-        list: An :math:`m`-list of :math:`k`-vectors, representing an :math:`m`-point latin hypercube sample of the :math:`k`-dimensional input domain.
+        np.array: An :math:`(m,k)` array of :math:`k`-vectors, representing an :math:`m`-point latin hypercube sample of the :math:`k`-dimensional input domain.
     """
+    rng = random_state(seed)
     #first, set default boundaries to 0,1 in k dimensions
-    if bounds==None:
-        bounds=[[0,1]for i in range(k)]
+    if bounds is None:
+        bounds=[[0,1] for i in range(k)]
+    lower, upper = np.asarray(bounds, dtype=float).T
         
     # for each dimension, choose randomly (without replacement) which bin each of the m sample points are from
-    # bins[i][j]=n says, "in the ith dimension, the jth sample point lands in bin n"
-    bins = [random_range(m) for i in range(k)]    
-        
-    # for each dimension, store the m left-boundaries of each bin
-    bin_width = [float(bounds[dim][1]-bounds[dim][0])/m for dim in range(k)]
-    bin_bound = [[bin_width[dim] * bin_no for bin_no in range(m)] for dim in range(k)]
+    # bins[j][i]=n says, "in the ith dimension, the jth sample point lands in bin n". Sorting a column
+    # of uniform draws gives an independent random permutation of the bins in every dimension at once.
+    bins = np.argsort(rng.uniform(size=(m, k)), axis=0)
     
-    samples = [
-        [
-            bin_bound[dim][bins[dim][bin_no]] + rand_sampler()*bin_width[dim] 
-            for dim in range(k)
-        ] for bin_no in range(m)
-    ]
-    return samples  
-"""          
-    # for each dimension, store the m centers of each bin
-    bin_width = [float(bounds[dim][1]-bounds[dim][0])/m for dim in range(k)]
-    bin_center = [[bin_width[dim] * (bin_no+0.5) for bin_no in range(m)] for dim in range(k)]
+    # where in its bin each sample point lands
+    if rand_sampler is None:
+        offsets = rng.uniform(size=(m, k))
+    else:
+        offsets = np.array([[rand_sampler() for dim in range(k)] for bin_no in range(m)])
     
-    # standard deviations are 1/6 of bin width for rough 95% of things landing within bins
-    bin_stdev = [bw/6 for bw in bin_width]
+    bin_width = (upper - lower) / m
+    return lower + (bins + offsets) * bin_width
     
-    samples = [
-        [
-            random.gauss(bin_center[dim][bins[dim][bin_no]],bin_stdev[dim])
-            for dim in range(k)
-        ] for bin_no in range(m)
-    ]
-      
-    return samples
-"""
-      
+def maximin_latin_hypercube(m, k, bounds=None, iterations=None, p=15, seed=None):
+    """
+    Args:
+        m (int): the number of desired sample points
+        k (int): the dimension of input space
+        bounds (list): the :math:`k` min-max tuples describing the function domain as a :math:`k`-rectangle. Defaults to the unit :math:`k`-cube.
+        iterations (int): the number of swaps tried; defaults to :math:`20m`
+        p (float): the exponent of the Morris-Mitchell criterion; the larger, the closer it is to the plain minimum distance
+        seed: an int, a numpy RandomState or Generator, or None; see :func:`random_state`
+            
+    Returns:
+        np.array: An :math:`(m,k)` latin hypercube sample whose points are spread apart, found by swapping coordinates between
+        pairs of points and keeping each swap that lowers :math:`\\phi_p = (\\sum_{i<j} d_{ij}^{-p})^{1/p}`.
+    A swap keeps the sample a latin hypercube, and changes only two rows of the distance matrix, so each one is
+    evaluated in :math:`O(m)` rather than :math:`O(m^2)`.
+    """
+    rng = random_state(seed)
+    if iterations is None:
+        iterations = 20*m
+    # optimize in the unit cube, so every dimension counts equally towards distance
+    X = latin_hypercube(m, k, seed=rng)
+    if m < 3:
+        return _scale(X, bounds)
+    
+    # squared distances, with an infinite diagonal so a point never counts itself
+    D = np.sum((X[:, None, :] - X[None, :, :])**2, axis=2)
+    np.fill_diagonal(D, np.inf)
+    # minimize the sum of d^-p over all pairs; distances are normalized to the initial minimum
+    # so that d^-p cannot overflow
+    scale = np.min(D)
+    half_p = p / 2.0
     
+    for _ in range(iterations):
+        i, j = rng.permutation(m)[:2]
+        dim = _randint(rng, k)
+        # squared distances from i and j to every point if their dim coordinates were swapped
+        old_i = (X[i, dim] - X[:, dim])**2
+        old_j = (X[j, dim] - X[:, dim])**2
+        new_Di = D[i] - old_i + old_j
+        new_Dj = D[j] - old_j + old_i
+        new_Di[[i, j]] = D[i, [i, j]]
+        new_Dj[[i, j]] = D[j, [i, j]]
+        change = (np.sum((new_Di/scale)**-half_p) + np.sum((new_Dj/scale)**-half_p)
+                  - np.sum((D[i]/scale)**-half_p) - np.sum((D[j]/scale)**-half_p))
+        if change < 0:
+            X[[i, j], dim] = X[[j, i], dim]
+            D[i], D[:, i] = new_Di, new_Di
+            D[j], D[:, j] = new_Dj, new_Dj
+    return _scale(X, bounds)
+    
+    
+## primitive polynomials and initial direction numbers for dimensions 2 through 21 of the sobol sequence,
+## (s, a, m_1..m_s) as in Joe and Kuo's new-joe-kuo-6.21201 table. The first dimension is the van der corput sequence.
+sobol_directions = [
+    (1, 0, [1]), (2, 1, [1, 3]), (3, 1, [1, 3, 1]), (3, 2, [1, 1, 1]), (4, 1, [1, 1, 3, 3]),
+    (4, 4, [1, 3, 5, 13]), (5, 2, [1, 1, 5, 5, 17]), (5, 4, [1, 1, 5, 5, 5]), (5, 7, [1, 1, 7, 11, 19]),
+    (5, 11, [1, 1, 5, 1, 1]), (5, 13, [1, 1, 1, 3, 11]), (5, 14, [1, 3, 5, 5, 31]),
+    (6, 1, [1, 3, 3, 9, 7, 49]), (6, 13, [1, 1, 1, 15, 21, 21]), (6, 16, [1, 3, 1, 13, 27, 49]),
+    (6, 19, [1, 1, 1, 15, 7, 5]), (6, 22, [1, 3, 1, 15, 13, 25]), (6, 25, [1, 1, 5, 5, 19, 61]),
+    (7, 1, [1, 3, 7, 11, 23, 15, 103]), (7, 4, [1, 3, 7, 13, 13, 15, 69]),
+]
 
+# bits of precision of each sobol coordinate
+sobol_bits = 30
+
+def sobol(m, k, bounds=None, scramble=True, seed=None):
+    """
+    Args:
+        m (int): the number of desired sample points (powers of 2 are best balanced)
+        k (int): the dimension of input space, at most 21
+        bounds (list): the :math:`k` min-max tuples describing the function domain as a :math:`k`-rectangle. Defaults to the unit :math:`k`-cube.
+        scramble (bool): whether the sequence is randomized, by a random linear matrix scramble and digital shift
+        seed: an int, a numpy RandomState or Generator, or None; see :func:`random_state`
+            
+    Returns:
+        np.array: the first :math:`m` points of a :math:`k`-dimensional sobol sequence over the domain
+    """
+    if k > len(sobol_directions) + 1:
+        raise ValueError('sobol sequences are available in at most '+str(len(sobol_directions)+1)+' dimensions; use halton or maximin_latin_hypercube')
+    rng = random_state(seed)
+    B = sobol_bits
+    # V[dim][j] is the jth direction number, as a B-bit integer
+    V = [[1 << (B - j - 1) for j in range(B)]]
+    for s, a, m_init in sobol_directions[:k-1]:
+        v = [m_init[j] << (B - j - 1) for j in range(s)]
+        for j in range(s, B):
+            new = v[j-s] ^ (v[j-s] >> s)
+            for l in range(1, s):
+                if (a >> (s - 1 - l)) & 1:
+                    new ^= v[j-l]
+            v.append(new)
+        V.append(v)
+    
+    shift = [0]*k
+    if scramble:
+        for dim in range(k):
+            V[dim] = _scramble_directions(V[dim], rng)
+            shift[dim] = _randint(rng, 1 << B)
+    
+    # the ith point is the xor of the direction numbers of the bits set in i
+    index = np.arange(m, dtype=np.int64)
+    ints = np.tile(np.array(shift, dtype=np.int64), (m, 1))
+    for j in range(B):
+        bit_set = ((index >> j) & 1).astype(bool)
+        if not bit_set.any():
+            break
+        ints[bit_set] ^= np.array([V[dim][j] for dim in range(k)], dtype=np.int64)
+    return _scale(ints / float(1 << B), bounds)
+    
+def _scramble_directions(v, rng):
+    ## left-multiplies each direction number (as a column of bits, most significant first) by a random lower
+    ## triangular binary matrix with a unit diagonal, which keeps the net properties of the sequence
+    B = sobol_bits
+    rows = [(1 << (B - r - 1)) | (_randint(rng, 1 << r) << (B - r)) for r in range(B)]
+    out = []
+    for direction in v:
+        scrambled = 0
+        for r in range(B):
+            if bin(rows[r] & direction).count('1') % 2:
+                scrambled |= 1 << (B - r - 1)
+        out.append(scrambled)
+    return out
+    
+def halton(m, k, bounds=None, scramble=True, seed=None, start=0):
+    """
+    Args:
+        m (int): the number of desired sample points
+        k (int): the dimension of input space
+        bounds (list): the :math:`k` min-max tuples describing the function domain as a :math:`k`-rectangle. Defaults to the unit :math:`k`-cube.
+        scramble (bool): whether each digit of the radical inverses is randomly permuted (independently for each
+            digit position), which breaks up the correlation between high dimensions of the plain sequence
+        seed: an int, a numpy RandomState or Generator, or None; see :func:`random_state`
+        start (int): the index of the first point returned. Calls with the same int seed and consecutive starts
+            return consecutive segments of one scrambled sequence.
+            
+    Returns:
+        np.array: the :math:`m` points from the :math:`start^{th}` on of a :math:`k`-dimensional halton sequence over the
+        domain, whose :math:`i^{th}` dimension is the radical inverse in the :math:`i^{th}` prime base
+    """
+    rng = random_state(seed)
+    # the unscrambled sequence starts at 1, as its 0th point is the corner of the domain
+    index = np.arange(start, start + m, dtype=np.int64) + (0 if scramble else 1)
+    X = np.empty((m, k))
+    for dim, base in enumerate(_primes(k)):
+        # enough digits to resolve doubles, so scrambling the trailing zero digits fills in the rest uniformly
+        n_digits = int(np.ceil(53 * np.log(2) / np.log(base))) if scramble else int(np.log(index[-1]) / np.log(base)) + 1
+        remaining = index.copy()
+        coord = np.zeros(m)
+        factor = 1.0 / base
+        for _ in range(n_digits):
+            digit = remaining % base
+            if scramble:
+                digit = rng.permutation(base)[digit]
+            coord += digit * factor
+            remaining //= base
+            factor /= base
+        X[:, dim] = coord
+    return _scale(X, bounds)
+    
+def _randint(rng, n):
+    ## a random int in [0, n), from either a RandomState or a Generator
+    draw = rng.randint if hasattr(rng, 'randint') else rng.integers
+    return int(draw(n))
+    
+def _primes(k):
+    ## the first k primes
+    primes = []
+    candidate = 2
+    while len(primes) < k:
+        if all(candidate % p for p in primes):
+            primes.append(candidate)
+        candidate += 1
+    return primes
+    
+def _scale(X, bounds):
+    ## maps points in the unit cube onto the bound-rectangle
+    if bounds is None:
+        return X
+    lower, upper = np.asarray(bounds, dtype=float).T
+    return lower + X * (upper - lower)
+    
 def diag(m, k, bounds=None):
     """
     Args:
@@ -91,6 +270,6 @@ def diag(m, k, bounds=None):
 
 ## returns a random permutation of python's range(n)
 def random_range(n):
-    out = range(n)
+    out = list(range(n))
     random.shuffle(out)
     return out
\ No newline at end of file
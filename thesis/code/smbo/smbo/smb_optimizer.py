@@ -7,27 +7,124 @@
 
 """
 from smbo import (
-    basinhopping,
     minimize,
     norm,
+    OptimizeResult,
     np,
     plt,
+    instrument,
     samplers
 )
 from smbo.lazyprop import lazyprop, reset_lps
+from smbo.trust_region import trust_region
+from smbo.sample_store import sample_store
+from smbo.memo import lru_memo
 from smbo.tests.test_funcs import branin
 
 from operator import add, sub
 from math import sqrt
+from multiprocessing import Pool, cpu_count
+import copy
+import os
+import pickle
+import random
+import zlib
+try:
+    import Queue as queue
+except ImportError:
+    import queue
 #current working directory
 from os import getcwd
 
+
+def evaluate_many(func, points):
+    """
+    Args:
+        func (function): a :math:`k`-to-1 function, such as a :code:`pred_y` or :code:`pred_err` returned by a modeller
+        points (np.array): an :math:`(m,k)` array of points from the domain
+    Returns:
+        np.array: func evaluated at each of the :math:`m` points.
+    If func is a model method with a batched counterpart named :code:`<name>_many` (e.g.
+    :meth:`smbo.models.dace.predict_many`), all the points are passed to it in one call;
+    otherwise func is called once per point.
+    """
+    batched = getattr(getattr(func, '__self__', None), getattr(func, '__name__', '') + '_many', None)
+    if batched is not None:
+        return np.asarray(batched(points), dtype=float)
+    return np.array([func(x) for x in points], dtype=float)
+    
+def expected_improvement(f_min, y, var):
+    """
+    Args:
+        f_min (float): the incumbent minimum objective value
+        y (np.array): predicted function values
+        var (np.array): predicted errors (variances) of those predictions
+    Returns:
+        np.array: the expected improvement (Jones Eq. 15) at each prediction, which is 0 wherever
+            the prediction is certain
+    """
+    y, var = np.asarray(y, dtype=float), np.asarray(var, dtype=float)
+    st_dev = np.sqrt(np.maximum(var, 0.0))
+    improvement = f_min - y
+    out = np.zeros(np.shape(y))
+    # catches points in X (already evaluated points, 100% certain of prediction)
+    uncertain = st_dev > 0.0
+    normed_improvement = improvement[uncertain] / st_dev[uncertain]
+    out[uncertain] = (improvement[uncertain] * norm.cdf(normed_improvement)
+                      + st_dev[uncertain] * norm.pdf(normed_improvement))
+    return out
+
+def evaluate_grid(func, axes, chunk_size=65536, fname=None):
+    """
+    Args:
+        func (function): a batched function, mapping an :math:`(m,k)` array of points to their :math:`m` values
+        axes (list): :math:`k` 1d arrays, the grid coordinates along each dimension
+        chunk_size (int): the most grid points generated (and passed to func) at once
+        fname (str): if given, the result is a :code:`np.memmap` backed by this file, so that grids too large
+            for memory can be evaluated
+    Returns:
+        np.array: the array of shape :code:`(len(axes[0]), ..., len(axes[k-1]))` whose :math:`(i_0,\ldots,i_{k-1})^{th}`
+        entry is func at the point :math:`(axes[0][i_0],\ldots,axes[k-1][i_{k-1}])`.
+    The grid is walked block by block in flat index order; only one block of points exists at a time, and each
+    block's values are written straight into the preallocated result.
+    """
+    axes = [np.asarray(axis, dtype=float) for axis in axes]
+    shape = tuple(len(axis) for axis in axes)
+    size = int(np.prod(shape))
+    if fname:
+        out = np.memmap(fname, dtype=float, mode='w+', shape=shape)
+    else:
+        out = np.empty(shape)
+    flat = out.reshape(-1)
+    for start in range(0, size, chunk_size):
+        coords = np.unravel_index(np.arange(start, min(start + chunk_size, size)), shape)
+        points = np.column_stack([axis[c] for axis, c in zip(axes, coords)])
+        flat[start:start + len(points)] = func(points)
+    if fname:
+        out.flush()
+    return out
+
+def candidate_chunks(bounds, total, chunk_size):
+    """
+    Args:
+        bounds (list): the :math:`k` (min,max) tuples of a :math:`k`-rectangle
+        total (int): the number of candidate points to generate
+        chunk_size (int): the most points generated at once
+    Returns:
+        generator: :math:`(m,k)` arrays of quasi-random points over bounds, the consecutive segments of at most
+            chunk_size points of the first total points of one scrambled halton sequence. Only one chunk exists at a time.
+    """
+    # one scramble for the whole sequence, drawn from numpy's global generator
+    seed = np.random.randint(2**31 - 1)
+    for start in range(0, total, chunk_size):
+        yield samplers.halton(min(chunk_size, total - start), len(bounds), bounds, seed=seed, start=start)
+
 class smb_optimizer:
     """ An object that, given an input domain, objective function, and modelling strategy, seeks to efficiently find
         the global optimum of the objective by the generation of sequential models.
     """
     
-    def __init__(self, domain, objective_func, modeller, init_sampler=None, res=0.05, brute_optimize_EI=False,logger=None):
+    def __init__(self, domain, objective_func, modeller, init_sampler=None, res=0.05, brute_optimize_EI=False,logger=None,acq_starts=10,acq_candidates=None,brute_candidates=None,brute_chunk=1000,grid_chunk=65536,buffer_dir=None,memo_size=0,memo_quantum=1e-9,refit_every=1,journal=None,objective_id=None,design=None,trust_regions=None,design_seed=None):
         """
         Args:
             domain (list): a :math:`k`-list of tuples describing the lower and upper bounds of each input dimension.
@@ -43,9 +140,45 @@ class smb_optimizer:
             init_sampler (function): a function which will select initial sample points, informing the zero-generation model. 
                 If left unspecified, is by default set to a :math:`2k+2`-sample latin hypercube over the domain,
                 created with :mod:`smbo.latin_hypercube`.
+            design (function): the design used for the default initial sample, a function :code:`design(m, k, bounds)`
+                such as :func:`smbo.samplers.maximin_latin_hypercube`, :func:`smbo.samplers.sobol` or
+                :func:`smbo.samplers.halton`. Defaults to :func:`smbo.samplers.latin_hypercube`; ignored if init_sampler is given.
+            design_seed (int): the seed the default initial sample is drawn with, passed to design as :code:`seed`.
+                With a journal it defaults to one derived from objective_id, so that a run interrupted during the
+                initial sample draws the same design when it is restarted.
             res(float): the resolution of any created plots
-            brute_optimize_EI(bool): if true, the expected improvement function is maximized by actually evaluating it over a plot_res grid and choosing the argmax. If False, it is maximized by a scipy optimizer. This allows for extremely slow, but trustworthy optimization.
+            brute_optimize_EI(bool): if true, the expected improvement function is maximized by evaluating it at a stream of
+                quasi-random candidates and refining around the best of them (see :meth:`stream_search`), rather than by
+                a scipy optimizer. This is slow, but trustworthy, and works in any dimension.
             logger: a python logging.logger object. If none, there is no logging
+            acq_starts (int): the number of bounded L-BFGS-B searches used to maximize expected improvement
+            acq_candidates (int): the number of random points whose expected improvement is screened to
+                choose those searches' starting points. Defaults to :math:`100k`.
+            brute_candidates (int): the number of candidates whose expected improvement is evaluated by a brute search.
+                Defaults to :math:`1000k`.
+            brute_chunk (int): the most candidates a brute search holds in memory (and evaluates in one batch) at once
+            grid_chunk (int): the most grid points the plotting buffers evaluate at once (see :func:`evaluate_grid`)
+            buffer_dir (str): if given, the plotting buffers are memory-mapped files in this directory rather than in memory
+            memo_size (int): if positive, up to this many single-point predictions and expected improvements (with
+                their gradients, as the acquisition search asks for them) are remembered in an :class:`smbo.memo.lru_memo` (self.memo), until the model next changes
+            memo_quantum (float): points closer than this fraction of the domain's width in every dimension share
+                a memo entry
+            refit_every (int): if the model has an :code:`update` method (as :class:`smbo.models.dace` does),
+                each new sample is added to the existing model rather than re-running :code:`modeller`, and
+                its parameters are only re-fit to maximize likelihood every refit_every samples.
+            journal (smbo.journal.journal): if given, every objective evaluation is written through to this durable
+                journal, and points already recorded there are not re-evaluated. The initial sample is evaluated
+                through it, so on a restart only the points it is missing are evaluated, and any evaluations of the
+                objective recorded after the initial sample are added to it.
+            objective_id (str): identifies the objective in the journal; required if there is a journal, as two objectives
+                sharing a name (every lambda, or every closure made by one factory) would read each other's values
+            trust_regions (int): if given, the optimizer runs in trust-region mode with this many regions (see
+                :mod:`smbo.trust_region`), started around the best initial samples. Each iteration, every region
+                fits a model to the samples inside it alone and proposes its own points by maximizing expected
+                improvement within its bounds, so the cost of a fit is bounded by the region rather than by
+                every sample taken. The optimizer's own pred_y and pred_err are then those of the region
+                holding the best sample. The regions' points are evaluated one after another unless
+                :meth:`take_samples` is given processes (or a batch_size above 1), when they run in parallel.
             X (list): The list of points where :code:`objective_func` has been evaluated already
             Y (list): The list of associated objective function values.
             pred_y (function), pred_err (function): The predictor and predicted error surfaces; the output of :code:`modeller(X,Y)`.
@@ -63,21 +196,51 @@ class smb_optimizer:
         self.objective_func = objective_func
         #self.plot_res=plot_res
         self.brute_optimize_EI=brute_optimize_EI
+        self.acq_starts = acq_starts
+        self.acq_candidates = acq_candidates or 100*self.k
+        self.brute_candidates = brute_candidates or 1000*self.k
+        self.brute_chunk = brute_chunk
+        self.grid_chunk = grid_chunk
+        self.buffer_dir = buffer_dir
+        self.memo = lru_memo(memo_size) if memo_size else None
+        self.memo_quantum = memo_quantum
+        self.refit_every = refit_every
+        self.samples_since_refit = 0
+        self.journal = journal
+        if journal is not None and not objective_id:
+            raise ValueError('an objective_id is required to keep evaluations in a journal')
+        self.objective_id = objective_id or getattr(objective_func, '__name__', repr(objective_func))
+        # the number of times samples have been added (one per take_samples iteration)
+        self.iteration = 0
         
         # set initial sample points (in the sample vector X) using init_sampler (default latin hypercube)
         # because it is only once, no need to store a self.init_sampler
         if not init_sampler:
             # use Jones' convention of 2k+2 sample points for the 2k+2 free variables in the DACE model
-            if   self.k == 1: self.X=samplers.latin_hypercube(4,self.k,self.domain)
-            elif self.k == 2: self.X=samplers.latin_hypercube(21,self.k,self.domain)
-            elif self.k == 3: self.X=samplers.latin_hypercube(33,self.k,self.domain)
-            else: self.X=samplers.latin_hypercube(10*k,self.k,self.domain)
+            design = design or samplers.latin_hypercube
+            if design_seed is None and self.journal is not None:
+                design_seed = zlib.crc32(self.objective_id.encode('utf-8')) & 0x7fffffff
+            seed = {} if design_seed is None else {'seed': design_seed}
+            if   self.k == 1: X=design(4,self.k,self.domain,**seed)
+            elif self.k == 2: X=design(21,self.k,self.domain,**seed)
+            elif self.k == 3: X=design(33,self.k,self.domain,**seed)
+            else: X=design(10*self.k,self.k,self.domain,**seed)
             
         else:
-            self.X=init_sampler()
-        self.n = len(self.X)
-        # get objective values for initial sample points
-        self.Y=[self.objective_func(x) for x in self.X]
+            X=init_sampler()
+        # get objective values for initial sample points (through the journal, if there is one)
+        X = [np.asarray(x, dtype=float) for x in X]
+        Y = [self.evaluate(x) for x in X]
+        if self.journal is not None:
+            # resuming: the samples an earlier run took after its initial sample
+            initial = set(self.journal.key(self.objective_id, x) for x in X)
+            for x, y in zip(*self.journal.evaluations(self.objective_id)):
+                if self.journal.key(self.objective_id, x) not in initial:
+                    X.append(np.asarray(x, dtype=float))
+                    Y.append(y)
+        # X and Y are read-only views of this store
+        self.samples = sample_store(self.k, X, Y)
+        self.n = len(self.samples)
         
         # now initialize the model:
         self.modeller = modeller
@@ -85,47 +248,85 @@ class smb_optimizer:
         self.pred_y, self.pred_err = self.modeller(self.X,self.Y)
         self.logger = logger
         
+        # trust regions start around the best few initial samples; model_region is the region
+        # (if any) whose local model pred_y and pred_err currently are
+        self.trust_regions = None
+        self.model_region = None
+        if trust_regions:
+            order = np.argsort(self.Y)
+            self.trust_regions = [trust_region(self.k, self.X[order[i % self.n]], self.Y[order[i % self.n]])
+                                  for i in range(trust_regions)]
+        
+    @property
+    def X(self):
+        """
+        np.array: the :math:`(n,k)` sample points, a read-only view of :code:`samples`
+        """
+        return self.samples.X
+        
+    @property
+    def Y(self):
+        """
+        np.array: the :math:`n` objective values of the sample points, a read-only view of :code:`samples`
+        """
+        return self.samples.Y
+        
+    # the buffers below hold a model surface over the res-spaced grid of grid_axes, as arrays of the grid's
+    # shape, one entry per grid point
     @lazyprop
     def improvement_buffer(self):
         """
         Stores expected improvement values for each point on the plot_point grid
         """
-        return [self.exp_improvement(point) for point in self.domain_buffer]
+        return self.grid_buffer(self.exp_improvement_many, 'improvement_buffer')
         
     @lazyprop
     def prediction_buffer(self):
         """
         Stores predicted function values for each point on the plot_point grid
         """
-        return [self.pred_y(point) for point in self.domain_buffer]
+        return self.grid_buffer(lambda points: evaluate_many(self.pred_y, points), 'prediction_buffer')
 
     @lazyprop
     def error_buffer(self):
         """
         Stores predicted function error values for each point on the plot_point grid
         """
-        scale=1
-        buff = [scale*sqrt(self.pred_err(point)) for point in self.domain_buffer]
+        buff = self.grid_buffer(lambda points: np.sqrt(evaluate_many(self.pred_err, points)), 'error_buffer')
         if self.logger:
             self.logger.info('error buffer: '+str(buff))
         return buff
         
+    def grid_buffer(self, func, name):
+        """
+        Args:
+            func (function): a batched function of an :math:`(m,k)` array of points
+            name (str): the name of the buffer, which names its file if buffer_dir is set
+        Returns:
+            np.array: func over the grid of grid_axes, by :func:`evaluate_grid`
+        """
+        fname = os.path.join(self.buffer_dir, name + '.dat') if self.buffer_dir else None
+        return evaluate_grid(func, self.grid_axes, self.grid_chunk, fname)
+        
     @lazyprop
-    def domain_buffer(self):
+    def grid_axes(self):
         """
         Returns:
-            np.array: a list of sample points that cover the domain in a grid with cell length of self.res in every dimension
+            list: the :math:`k` arrays of grid coordinates, spaced self.res apart, along each dimension of the domain
         """
-        grid_bounds = [np.arange(self.domain[i][0], self.domain[i][1], self.res) for i in range(self.k)]
+        return [np.arange(self.domain[i][0], self.domain[i][1], self.res) for i in range(self.k)]
         
-        if self.k>1:
-            mesh = np.transpose(np.meshgrid(*grid_bounds))
-        else:
-            mesh = grid_bounds[0]
-            
-        points = mesh.reshape(len(mesh.flatten())/self.k,self.k)
-
-        return points
+    @lazyprop
+    def domain_buffer(self):
+        """
+        Returns:
+            np.array: a list of sample points that cover the domain in a grid with cell length of self.res in every dimension,
+                in the order of the flattened buffers. This holds every grid point at once; the buffers themselves
+                never need it.
+        """
+        shape = tuple(len(axis) for axis in self.grid_axes)
+        coords = np.unravel_index(np.arange(int(np.prod(shape))), shape)
+        return np.column_stack([axis[c] for axis, c in zip(self.grid_axes, coords)])
                         
     @lazyprop 
     def f_min(self):
@@ -135,29 +336,101 @@ class smb_optimizer:
         min_index = np.argmin(self.Y)
         return ( { 'x': self.X[ min_index ], 'y': self.Y[ min_index ] } )
         
-    # expected improvement function (Jones Eq. 15) (eps is included for floating point rounding errs)
-    def exp_improvement(self, x_new):
+    # the modeller hands back two separate functions, but if they are methods of one model
+    # with a fused pred_stats, the prediction and its error are computed from one correlation vector
+    def memo_key(self, kind, x):
         """
         Returns:
-            float: the expected improvement function evaluated at x_new
+            tuple: the :code:`memo` key of the kind ('stats', 'ei' or 'ei_grad') of evaluation at x, whose coordinates are
+                rounded to multiples of memo_quantum times the width of the domain
         """
-        y = self.pred_y(x_new)
-        # improvement over current minimum
-        improvement = self.f_min['y'] - y
+        lower, upper = np.array(self.domain, dtype=float).T
+        quantized = np.round((np.asarray(x, dtype=float).ravel() - lower) / ((upper - lower) * self.memo_quantum))
+        return (kind,) + tuple(quantized.astype(np.int64).tolist())
+        
+    def pred_stats(self, x_new):
+        """
+        Returns:
+            tuple: (y, err), :code:`pred_y` and :code:`pred_err` evaluated at x_new (remembered in :code:`memo`, if there is one)
+        """
+        if self.memo is not None:
+            return self.memo.get(self.memo_key('stats', x_new), lambda: self._pred_stats(x_new))
+        return self._pred_stats(x_new)
         
-        # s
-        err = self.pred_err(x_new)
-        if (err < 0):
-            print('Error: pred_err(x) < 0 for x = ' + str(x_new) + '; pred_err(x) = ' + str(err))
+    def _pred_stats(self, x_new):
+        fused = getattr(getattr(self.pred_y, '__self__', None), 'pred_stats', None)
+        if fused is not None:
+            return fused(x_new)
+        return (self.pred_y(x_new), self.pred_err(x_new))
         
-        st_dev = sqrt(self.pred_err(x_new))
+    def pred_stats_many(self, points):
+        """
+        Args:
+            points (np.array): an :math:`(m,k)` array of points from the domain
+        Returns:
+            tuple: (ys, errs), arrays of :code:`pred_y` and :code:`pred_err` evaluated at each point
+        """
+        fused = getattr(getattr(self.pred_y, '__self__', None), 'pred_stats_many', None)
+        if fused is not None:
+            ys, errs = fused(points)
+            return (np.asarray(ys, dtype=float), np.asarray(errs, dtype=float))
+        return (evaluate_many(self.pred_y, points), evaluate_many(self.pred_err, points))
+        
+    # expected improvement function (Jones Eq. 15)
+    def exp_improvement(self, x_new):
+        """
+        Returns:
+            float: the expected improvement function evaluated at x_new (remembered in :code:`memo`, if there is one)
+        """
+        if self.memo is not None:
+            return self.memo.get(self.memo_key('ei', x_new), lambda: self._exp_improvement(x_new))
+        return self._exp_improvement(x_new)
+        
+    @instrument.timed('ei')
+    def _exp_improvement(self, x_new):
+        y, err = self.pred_stats(x_new)
+        return float(expected_improvement(self.f_min['y'], y, err))
         
-        # catches when x_new is in X (already evaluated points, 100% certain of prediction)
-        if (st_dev == 0.0): return(0.0)
+    def exp_improvement_grad(self, x_new):
+        """
+        Returns:
+            tuple:
+                (ei, ei_grad): the expected improvement at x_new and its gradient with respect to x_new
+                (remembered in :code:`memo`, if there is one). ei_grad is None if the model has no
+                :code:`pred_stats_grad` method.
+        With :math:`I = f_{min}-\\hat{y}` and :math:`z = I/s`, the derivative of Jones Eq. 15 reduces to
+        :math:`-\\Phi(z)\\nabla\\hat{y} + \\phi(z)\\nabla s`.
+        """
+        if self.memo is not None:
+            return self.memo.get(self.memo_key('ei_grad', x_new), lambda: self._exp_improvement_grad(x_new))
+        return self._exp_improvement_grad(x_new)
         
+    @instrument.timed('ei')
+    def _exp_improvement_grad(self, x_new):
+        fused = getattr(getattr(self.pred_y, '__self__', None), 'pred_stats_grad', None)
+        if fused is None:
+            return (self.exp_improvement(x_new), None)
+        y, err, y_grad, err_grad = fused(x_new)
+        st_dev = sqrt(err)
+        if st_dev == 0.0:
+            return (0.0, np.zeros(self.k))
+        improvement = self.f_min['y'] - y
         normed_improvement = improvement/st_dev
+        ei = improvement * norm.cdf(normed_improvement) + st_dev * norm.pdf(normed_improvement)
+        ei_grad = -norm.cdf(normed_improvement) * y_grad + norm.pdf(normed_improvement) * err_grad / (2 * st_dev)
+        return (ei, ei_grad)
         
-        return(improvement * norm.cdf(normed_improvement) + st_dev * norm.pdf(normed_improvement))
+    @instrument.timed('ei')
+    def exp_improvement_many(self, points):
+        """
+        Args:
+            points (np.array): an :math:`(m,k)` array of points from the domain
+        Returns:
+            np.array: the expected improvement function evaluated at each point, from one
+                batched model evaluation
+        """
+        ys, errs = self.pred_stats_many(points)
+        return expected_improvement(self.f_min['y'], ys, errs)
     
     @lazyprop
     def next_sample(self):
@@ -166,51 +439,348 @@ class smb_optimizer:
             randomize (bool): if true, the next sample point is chosen randomly with probability weighted by expected improvement; otherwise, returns the point in the input domain with the highest expected improvement. NOTE: does nothing for now. Disabled!
         Chooses the next sample point
         """  
-        if self.brute_optimize_EI:
-            return self.plot_points[np.argmax(self.error_buffer)]
-        else: 
-            return self.improvement_data.x
+        return self.improvement_data.x
         
     @lazyprop
+    @instrument.timed('acquisition')
     def improvement_data(self):
         """
         So that it may be accessed by different class methods, this stores the maximization
-        result of the expected improvement function
-        """
-        def neg_imp(x_new): return -(self.exp_improvement(x_new))
-        
-        # cludgey workaround to use a global optimizer
-        def adjusted_neg_imp(x_new):
-            def in_domain(x):
-                for i in range(self.k):
-                    if x[i]<self.domain[i][0] or x[i]>self.domain[i][1]: return False
-                return True
-            if in_domain(x_new):
-                return neg_imp(x_new)
-            else:
-                return 100.0
-        
-        # initial minimization guess in the center of the n-rectangle of interest
-        x0 = [(self.domain[i][1]+self.domain[i][0])/float(2) for i in range(self.k)]
-        minimizer_kwargs = {"method": "COBYLA"}
-        res = basinhopping(adjusted_neg_imp, x0,minimizer_kwargs=minimizer_kwargs,niter=200)
-        #below is how to just use scipy.minize
-        #res = minimize(neg_imp, x0, method='SLSQP',bounds=self.domain)
+        result of the expected improvement function. It is the best of :code:`acq_starts` bounded
+        L-BFGS-B searches, which use the analytic EI gradient when the model provides one, or with
+        :code:`brute_optimize_EI` the result of :meth:`stream_search`.
+        """
+        if self.brute_optimize_EI:
+            return self.stream_search(self.brute_candidates, self.brute_chunk, self.acq_starts)
+        
+        # start from the best few of a batch of random points, screened in one batched call
+        # (EI is nearly flat far from the data, where a local search would not move)
+        lower, upper = np.array(self.domain, dtype=float).T
+        candidates = np.random.uniform(lower, upper, (self.acq_candidates, self.k))
+        imps = self.exp_improvement_many(candidates)
+        starts = candidates[np.argsort(imps)[::-1][:self.acq_starts]]
+        
+        jac = getattr(getattr(self.pred_y, '__self__', None), 'pred_stats_grad', None) is not None
+        def neg_imp(x_new):
+            ei, ei_grad = self.exp_improvement_grad(x_new)
+            if not jac: return -ei
+            return (-ei, -ei_grad)
+        
+        res = None
+        for x0 in starts:
+            this_res = minimize(neg_imp, x0, method='L-BFGS-B', jac=jac, bounds=self.domain)
+            if res is None or this_res.fun < res.fun:
+                res = this_res
         return res        
     
+    def stream_search(self, total, chunk_size, keep, rounds=3):
+        """
+        Args:
+            total (int): the number of quasi-random candidates screened over the domain
+            chunk_size (int): the most candidates evaluated (and held) at once
+            keep (int): the number of best candidates carried between chunks and refined
+            rounds (int): the number of refinement rounds
+        Returns:
+            OptimizeResult: x, the candidate of greatest expected improvement found, and fun, minus that improvement
+        Expected improvement is evaluated batch by batch over :func:`candidate_chunks`, keeping only the keep best
+        points. Each refinement round then screens a chunk spread over small boxes around those points, each
+        half the size of the last; the first is twice the spacing of the screening candidates. Memory stays at
+        one chunk in any dimension.
+        """
+        lower, upper = np.array(self.domain, dtype=float).T
+        best_X, best_imps = np.empty((0, self.k)), np.empty(0)
+        
+        def fold(points, best_X, best_imps):
+            # the keep best of the points so far and the new ones
+            points = np.vstack((best_X, points))
+            imps = np.concatenate((best_imps, self.exp_improvement_many(points[len(best_X):])))
+            top = np.argsort(imps)[::-1][:keep]
+            return points[top], imps[top]
+        
+        for chunk in candidate_chunks(self.domain, total, chunk_size):
+            best_X, best_imps = fold(chunk, best_X, best_imps)
+        
+        side = 2.0 * (upper - lower) / float(total) ** (1.0 / self.k)
+        per_point = max(1, chunk_size // len(best_X))
+        for _ in range(rounds):
+            boxes = [list(zip(np.maximum(x - side/2, lower), np.minimum(x + side/2, upper))) for x in best_X]
+            local = np.vstack([samplers.halton(per_point, self.k, box) for box in boxes])
+            best_X, best_imps = fold(local, best_X, best_imps)
+            side = side / 2.0
+        return OptimizeResult(x=best_X[0], fun=-best_imps[0])
+        
+    def evaluate(self, x):
+        """
+        Returns:
+            float: :code:`objective_func(x)`, written through to (or, if already recorded, read from) the journal if there is one
+        """
+        if self.journal is None:
+            return self.call_objective(x)
+        return self.journal.evaluate(self.call_objective, x, self.objective_id)
+        
+    @instrument.timed('objective')
+    def call_objective(self, x):
+        """
+        Returns:
+            float: :code:`objective_func(x)`, timed as an 'objective' section of :mod:`smbo.instrument`
+        """
+        return self.objective_func(x)
+        
+    def evaluate_batch(self, points, pool=None):
+        """
+        Args:
+            points (np.array): an :math:`(m,k)` array of points from the domain
+            pool (multiprocessing.Pool): if given, the evaluations not already in the journal are run concurrently on it
+        Returns:
+            list: :meth:`evaluate` at each point
+        """
+        if pool is None:
+            return [self.evaluate(x) for x in points]
+        values = [self.journal.get(self.objective_id, x) if self.journal else None for x in points]
+        todo = [i for i in range(len(points)) if values[i] is None]
+        with instrument.section('objective', count=len(todo)):
+            ys = pool.map(self.objective_func, [points[i] for i in todo])
+        for i, y in zip(todo, ys):
+            values[i] = y
+            if self.journal: self.journal.record(self.objective_id, points[i], y)
+        return values
+        
     def sample(self):
         """
             Chooses the next sample point by maximizing :code:`exp_improvement`.
             Evaluates :code:`objective_func` there, updating :code:`X` and :code:`Y`. Regenerates predictive models.
+            In trust-region mode, samples one point in every region instead (see :meth:`sample_trust_regions`).
         """
-        self.X = np.append(self.X, np.array(self.next_sample))
-        # Append flattens the array; this fixes
-        self.X.resize(self.n+1,self.k)
-        self.Y = np.append(self.Y, self.objective_func(self.X[self.n]))
-        self.n += 1
-        self.Y.resize(self.n)
-        self.pred_y, self.pred_err = self.modeller(self.X,self.Y)
+        if self.trust_regions:
+            self.sample_trust_regions()
+            return
+        x_new = np.array(self.next_sample, dtype=float).reshape(1, self.k)
+        self.add_samples(x_new, [self.evaluate(x_new[0])])
+        
+    def sample_batch(self, q, pool=None, liar='believer'):
+        """
+        Args:
+            q (int): the number of points to sample
+            pool (multiprocessing.Pool): if given, the :math:`q` objective evaluations are run concurrently on it
+                (so :code:`objective_func` must be picklable, e.g. a module-level function)
+            liar (str): the fantasy value assumed at each pending point; see :meth:`propose_batch`
+        Chooses :math:`q` sample points with :meth:`propose_batch`, evaluates :code:`objective_func` at all of
+        them, and folds the results into X, Y and the model in one update.
+        """
+        new_X = self.propose_batch(q, liar)
+        self.add_samples(new_X, self.evaluate_batch(new_X, pool))
+        
+    def propose_batch(self, q, liar='believer'):
+        """
+        Args:
+            q (int): the number of points to propose
+            liar (str): the value assumed at each pending point before it is evaluated. 'believer' uses the
+                model's prediction there (kriging believer); 'min', 'mean' or 'max' use that statistic of Y
+                (constant liar).
+        Returns:
+            np.array: a :math:`(q,k)` array of points to sample. The first is :code:`next_sample`; each next one
+                maximizes expected improvement under a fantasy model in which the points before it have been
+                sampled, which pushes the batch apart.
+        """
+        points = []
+        current = self
+        for i in range(q):
+            x_new = np.array(current.next_sample, dtype=float)
+            points.append(x_new)
+            if i+1 < q:
+                current = current.fantasy(x_new, current.fantasy_value(x_new, liar))
+        return np.array(points)
+        
+    def with_pending(self, pending, liar='believer'):
+        """
+        Args:
+            pending (list): points whose objective evaluations have been started but have not returned
+            liar (str): the value assumed at each pending point; see :meth:`propose_batch`
+        Returns:
+            smb_optimizer: a fantasy optimizer (see :meth:`fantasy`) in which the pending points have
+                already been sampled, so that its :code:`next_sample` steers away from them
+        """
+        current = self
+        for x_pending in pending:
+            current = current.fantasy(x_pending, current.fantasy_value(x_pending, liar))
+        return current
+        
+    def local_optimizer(self, region):
+        """
+        Args:
+            region (trust_region): one of this optimizer's trust regions
+        Returns:
+            smb_optimizer: a copy of this optimizer, sharing its objective and modeller, whose domain is the
+                region's bounds and whose samples and model are only those inside the region (or, if there are
+                fewer than :math:`2k+2` of those, the :math:`2k+2` nearest its center). Its :code:`next_sample`
+                maximizes expected improvement within the region; this optimizer is left unchanged.
+        """
+        other = copy.copy(self)
+        reset_lps(other)
+        other.memo = lru_memo(self.memo.maxsize) if self.memo is not None else None
+        other.trust_regions = None
+        other.domain = region.bounds(self.domain)
+        lower, upper = np.array(other.domain, dtype=float).T
+        X, Y = self.X, self.Y
+        inside = np.flatnonzero(np.all((X >= lower) & (X <= upper), axis=1))
+        # Jones' convention of 2k+2 points for the 2k+2 free variables of the DACE model
+        if len(inside) < 2*self.k + 2:
+            width = np.array([hi - lo for lo, hi in self.domain], dtype=float)
+            inside = np.argsort(np.sum(((X - region.center) / width)**2, axis=1))[:2*self.k + 2]
+        other.samples = sample_store(self.k, X[inside], Y[inside])
+        other.n = len(inside)
+        if region is not self.model_region:
+            other.pred_y, other.pred_err = self.modeller(other.X, other.Y)
+        return other
+        
+    def local_optimizers(self):
+        """
+        Returns:
+            list: the :meth:`local_optimizer` of each trust region
+        """
+        return [self.local_optimizer(region) for region in self.trust_regions]
+        
+    def incumbent_region(self):
+        """
+        Returns:
+            trust_region: the trust region centered on the best sample found by any of them
+        """
+        return min(self.trust_regions, key=lambda region: region.best)
+        
+    def sample_trust_regions(self, local=None, q=1, pool=None, liar='believer'):
+        """
+        Args:
+            local (list): the :meth:`local_optimizers`, if they have already been built for the current samples
+            q (int): the number of points each region proposes (with :meth:`propose_batch`)
+            pool (multiprocessing.Pool): if given, the objective evaluations are run concurrently on it
+            liar (str): the fantasy strategy of :meth:`propose_batch`
+        Proposes q points in every trust region from its local model, evaluates them all, and resizes and
+        recenters each region by how its own points fared. A region that has collapsed is restarted, at full
+        size, around a uniformly random point of the domain.
+        """
+        if local is None: local = self.local_optimizers()
+        batches = [opt.propose_batch(q, liar) for opt in local]
+        new_X = np.vstack(batches)
+        new_Y = self.evaluate_batch(new_X, pool)
+        for i, region in enumerate(self.trust_regions):
+            region.record(batches[i], new_Y[i*q:(i+1)*q])
+            if region.collapsed:
+                lower, upper = np.array(self.domain, dtype=float).T
+                self.trust_regions[i] = trust_region(self.k, np.random.uniform(lower, upper))
+        self.add_samples(new_X, new_Y)
+        
+    def fantasy_value(self, x_new, liar='believer'):
+        """
+        Returns:
+            float: the value assumed at x_new before it is evaluated; see :meth:`propose_batch`
+        """
+        if liar == 'believer':
+            return self.pred_y(x_new)
+        return {'min': np.min, 'mean': np.mean, 'max': np.max}[liar](self.Y)
+        
+    def fantasy(self, x_new, y_new):
+        """
+        Returns:
+            smb_optimizer: a copy of this optimizer, sharing its objective and modeller, with (x_new, y_new) added
+                to its samples. A model with an :code:`update` method is copied and extended with the model
+                parameters held; this optimizer and its model are left unchanged.
+        """
+        other = copy.copy(self)
+        reset_lps(other)
+        # a fantasy has its own model, so its own memo
+        other.memo = lru_memo(self.memo.maxsize) if self.memo is not None else None
+        # the samples are copied, as appending to a shared store would write into this optimizer's
+        other.samples = self.samples.copy()
+        other.samples.extend([x_new], [y_new])
+        other.n = self.n + 1
+        model = getattr(self.pred_y, '__self__', None)
+        if hasattr(model, 'update'):
+            model = copy.deepcopy(model)
+            model.update(x_new, y_new, refit=False)
+            other.pred_y = getattr(model, self.pred_y.__name__)
+            other.pred_err = getattr(model, self.pred_err.__name__)
+        else:
+            other.pred_y, other.pred_err = other.modeller(other.X, other.Y)
+        return other
+        
+    def add_samples(self, new_X, new_Y):
+        """
+        Args:
+            new_X (list): newly evaluated sample points
+            new_Y (list): their objective values
+        Appends the new samples to X and Y and updates the model with them, forgetting everything in :code:`memo`.
+        If :mod:`smbo.instrument` is enabled, this ends an iteration there, recording the work since the last.
+        """
+        new_X = np.reshape(np.asarray(new_X, dtype=float), (-1, self.k))
+        self.samples.extend(new_X, new_Y)
+        self.n = len(self.samples)
+        self.iteration += 1
+        self.update_model(new_X, np.asarray(new_Y, dtype=float))
         reset_lps(self)
+        if self.memo is not None: self.memo.clear()
+        instrument.end_iteration(iteration=self.iteration, n=self.n)
+        
+    # attributes that are not saved by checkpoint, and are handed back to resume instead
+    unsaved = ('objective_func', 'modeller', 'logger', 'journal', 'pred_y', 'pred_err')
+    
+    def checkpoint(self, fname):
+        """
+        Args:
+            fname (str): the file to write
+        Saves everything needed to continue this optimization (X, Y, the fitted model and its
+        factorization, the iteration counter and the states of the random number generators) as a
+        binary pickle, which :func:`resume` restores. The objective function and modeller are not
+        saved. The file is replaced atomically, so an interruption mid-write leaves the previous
+        checkpoint intact.
+        """
+        saved = copy.copy(self)
+        reset_lps(saved)
+        for attr in self.unsaved:
+            saved.__dict__.pop(attr, None)
+        model = getattr(self.pred_y, '__self__', None)
+        if model is not None:
+            compact = getattr(model, 'compact', None)
+            saved.model = compact() if compact else model
+            saved.model_methods = (self.pred_y.__name__, self.pred_err.__name__)
+        saved.random_states = (np.random.get_state(), random.getstate())
+        
+        tmp_fname = fname + '.tmp'
+        with open(tmp_fname, 'wb') as f:
+            pickle.dump(saved, f, pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.rename(tmp_fname, fname)
+        except OSError:
+            # windows won't rename over an existing file
+            os.remove(fname)
+            os.rename(tmp_fname, fname)
+        
+    @instrument.timed('model_update')
+    def update_model(self, new_X, new_Y):
+        """
+        Args:
+            new_X (np.array), new_Y (np.array): the sample points (and their values) most recently added to X and Y
+        Brings the model up to date with X and Y. A model with an :code:`update` method is extended in place,
+        re-fitting its parameters (at most once, after the last new point) when :code:`refit_every` samples
+        have been added since the last fit; any other model is rebuilt with :code:`modeller`.
+        In trust-region mode, only the model of the :meth:`incumbent_region` is rebuilt.
+        """
+        if self.trust_regions:
+            self.model_region = None
+            local = self.local_optimizer(self.incumbent_region())
+            self.pred_y, self.pred_err = local.pred_y, local.pred_err
+            self.model_region = self.incumbent_region()
+            return
+        update = getattr(getattr(self.pred_y, '__self__', None), 'update', None)
+        if update is None:
+            self.pred_y, self.pred_err = self.modeller(self.X,self.Y)
+            return
+        self.samples_since_refit += len(new_X)
+        refit = self.samples_since_refit >= self.refit_every
+        if refit: self.samples_since_refit = 0
+        for i in range(len(new_X)):
+            update(new_X[i], new_Y[i], refit=(refit and i == len(new_X)-1))
         
     def check_memory(self, eps=1e-6):
         """
@@ -232,7 +802,7 @@ class smb_optimizer:
         if type(plot_dims)==int:
             return self.plot1d
     
-    def take_samples(self, stopping_improvement=0.01, max_iters=100, plot_dims=None, fname='plots/',verbose=True,leg_ids=[0]):
+    def take_samples(self, stopping_improvement=0.01, max_iters=100, plot_dims=None, fname='plots/',verbose=True,leg_ids=[0],batch_size=1,processes=None,liar='believer',checkpoint=None):
         """
         Args:
             stopping_improvement(float): the iterative process terminates if the maximum expected improvement nowhere is larger than this value
@@ -241,53 +811,122 @@ class smb_optimizer:
             fname (string): the prefix of the filename of each file to be saved
             randomize (bool): disabled; being passed along
             leg_ids (list(int)): the loop numbers of plots that should include legends
-        Iteratively chooses a sample point, evaluates the objective function, and refits the model
+            batch_size (int): the number of points sampled per iteration (see :meth:`sample_batch`); in trust-region
+                mode, the number sampled in each region
+            processes (int): the number of worker processes evaluating each batch; defaults to one per batch point.
+                If 1, or if batch_size is 1 and processes is not given, the objective is evaluated in this process
+                (in trust-region mode too, however many regions there are).
+            liar (str): the fantasy strategy of :meth:`propose_batch`
+            checkpoint (str): if given, a :meth:`checkpoint` is written to this file after every iteration
+        Iteratively chooses a sample point (or batch of them), evaluates the objective function, and refits the model
+        """
+        pool = None
+        # the regions' points are evaluated concurrently only if asked for, as a closure objective cannot be pickled
+        if (batch_size > 1 and processes != 1) or (processes is not None and processes != 1):
+            pool = Pool(processes or batch_size * len(self.trust_regions or [None]))
+        try:
+            self._sample_loop(stopping_improvement, max_iters, plot_dims, fname, verbose, leg_ids, batch_size, pool, liar, checkpoint)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            
+    def take_samples_async(self, max_evals=100, processes=None, stopping_improvement=None, liar='believer', poll=1.0, verbose=True, checkpoint=None):
+        """
+        Args:
+            max_evals (int): the total number of objective evaluations to run
+            processes (int): the number of worker processes, each kept busy with one evaluation; defaults to the number of CPUs
+            stopping_improvement (float): if set, no new evaluations are started once the best expected improvement
+                (given the pending points) is no larger than this; those still running are collected
+            liar (str): the value assumed at pending points; see :meth:`propose_batch`
+            poll (float): how often, in seconds, running evaluations are checked for exceptions
+            checkpoint (str): if given, a :meth:`checkpoint` is written to this file after every returned evaluation
+        Unlike :meth:`take_samples`, workers do not wait for each other: as soon as any evaluation returns, its result
+        is added to the model and a new point, chosen with the still-pending points accounted for by
+        :meth:`with_pending`, is started in the freed worker (unless the journal already holds its value, which is then
+        added at once). :code:`objective_func` must be picklable.
+        Trust-region mode is not supported.
         """
+        if self.trust_regions:
+            raise ValueError('take_samples_async does not support trust-region mode; use take_samples')
+        pool = Pool(processes)
+        n_workers = processes or cpu_count()
+        done = queue.Queue()
+        # job number -> (point, AsyncResult)
+        pending = {}
+        started = 0
+        try:
+            while True:
+                while started < max_evals and len(pending) < n_workers:
+                    current = self.with_pending([x for x, _ in pending.values()], liar)
+                    x_new = np.array(current.next_sample, dtype=float)
+                    if stopping_improvement is not None and current.exp_improvement(x_new) <= stopping_improvement:
+                        max_evals = started
+                        break
+                    y_known = self.journal.get(self.objective_id, x_new) if self.journal else None
+                    if y_known is not None:
+                        # evaluated before (e.g. ahead of an interruption), so it is added without running it again
+                        if verbose: print('evaluation '+str(started)+' at '+str(x_new)+' read from the journal: '+str(y_known))
+                        started += 1
+                        self.add_samples([x_new], [y_known])
+                        if checkpoint: self.checkpoint(checkpoint)
+                        continue
+                    if verbose: print('starting evaluation '+str(started)+' at '+str(x_new))
+                    callback = lambda y, job=started: done.put((job, y))
+                    pending[started] = (x_new, pool.apply_async(self.objective_func, (x_new,), callback=callback))
+                    started += 1
+                if not pending: return
+                try:
+                    job, y_new = done.get(timeout=poll)
+                except queue.Empty:
+                    # a failed evaluation never calls back; get() re-raises its exception here
+                    for x_new, result in pending.values():
+                        if result.ready() and not result.successful(): result.get()
+                    continue
+                x_new, _ = pending.pop(job)
+                if verbose: print('evaluation '+str(job)+' returned '+str(y_new))
+                if self.journal: self.journal.record(self.objective_id, x_new, y_new)
+                # the evaluation ran alongside everything else, so it is counted but not timed
+                instrument.add('objective', 0.0)
+                self.add_samples([x_new], [y_new])
+                if checkpoint: self.checkpoint(checkpoint)
+        finally:
+            pool.terminate()
+            pool.join()
+            
+    def _sample_loop(self, stopping_improvement, max_iters, plot_dims, fname, verbose, leg_ids, batch_size, pool, liar, checkpoint):
         # generate inital plots
         if (type(plot_dims)==int):
             self.plot1d(fname=fname+'0.pdf',plot_objective=True,plot_improvement=True)
         for i in range(max_iters):
+            # look at the expected improvement of the best sample point (of any trust region)
+            local = self.local_optimizers() if self.trust_regions else [self]
+            best_improvement, best = max(((opt.exp_improvement(opt.next_sample), opt) for opt in local), key=lambda pair: pair[0])
             if verbose: 
-                print('best place to sample: '+str(self.next_sample))
-                print('expected improvement there: '+str(self.exp_improvement(self.next_sample)))
-            # look at the expected improvement of the best sample point
-            if self.exp_improvement(self.next_sample)<=stopping_improvement: return
-            self.sample()
+                print('best place to sample: '+str(best.next_sample))
+                print('expected improvement there: '+str(best_improvement))
+            if best_improvement<=stopping_improvement: return
+            if self.trust_regions:
+                self.sample_trust_regions(local, batch_size, pool, liar)
+            elif batch_size > 1:
+                self.sample_batch(batch_size, pool, liar)
+            else:
+                self.sample()
+            if checkpoint: self.checkpoint(checkpoint)
             # 1d plot
             if (type(plot_dims)==int):
                 # plot legend only on first plot
                 self.plot1d(fname=fname+str(i+1)+'.pdf',plot_objective=True,plot_improvement=True,legend= ((i+1) in leg_ids))
             # 2d plot
-            elif (len(plot_dims)==2):
+            elif plot_dims is not None and len(plot_dims)==2:
                 self.plot2d(fname='2d_'+fname+str(i+1)+'.pdf')
             
     def plot2d(self, plotfreq=1, show_plot=False, fname='plots/2dtestplot.pdf'):
                 
-        xs = np.arange(self.domain[0][0], self.domain[0][1], self.res)
-        ys = np.arange(self.domain[1][0], self.domain[1][1], self.res)
-        xs, ys = np.meshgrid(xs, ys)
-        def pred(i,j):
-            #if (i*len(xs[0])+j)%100==0:
-                #print('making ' +str(i*len(xs[0])+j) + 'th prediction')
-            return self.pred_y([xs[i][j],ys[i][j]])
-            
-            
-        #print('about to make Z')
-            
-        Z = [[pred(i,j) for j in range(len(xs[i]))] for i in range(len(xs))]
-                
-        #Z = [ [ self.objective_func([xs[i][j],ys[i][j]]) for j in range(len(xs[i]) )] for i in range(len(xs))]
-        """
-        xs = self.domain_buffer.transpose()[0]
-        ys = self.domain_buffer.transpose()[1]
-        def prediction(i):
-            if i%100==0:
-                print('making ' +str(i) + 'th prediction')
-                print('with x = ('+str(xs[i])+', '+str(ys[i])+')')
-            return self.pred_y([xs[i],ys[i]])
+        # the predictor over the grid, chunk by chunk; transposed, as contour wants rows along y
+        Z = self.prediction_buffer.T
+        xs, ys = np.meshgrid(self.grid_axes[0], self.grid_axes[1])
         
-        Z = [ prediction(i) for i in range(len(xs)) ]
-        """
         print('got the Z')
         plt.figure()
         CS = plt.contour(xs, ys, Z,20)
@@ -379,7 +1018,7 @@ class smb_optimizer:
         if plot_improvement:
             ax2 = ax.twinx()
             ax2.axis([x_min, x_max, 0, 1])
-            imps = [ self.exp_improvement([x]) for x in pred_range ]
+            imps = self.exp_improvement_many(pred_range.reshape(-1, 1))
             # if you're plotting, might as well use that info for maximization
             exp_imp_line, = ax2.plot(pred_range, imps, color='r',label= 'expected improvement')
             ax2.set_ylabel( 'expected improvement', color='r')
@@ -418,4 +1057,36 @@ class smb_optimizer:
         if show_plot: plt.show()
         plt.close()
         
-        
\ No newline at end of file
+        
+        
+        
+def resume(fname, objective_func, modeller, journal=None, logger=None):
+    """
+    Args:
+        fname (str): a file written by :meth:`smb_optimizer.checkpoint`
+        objective_func (function), modeller (function), journal, logger: as passed to the checkpointed
+            smb_optimizer, since these are not saved
+    Returns:
+        smb_optimizer: the checkpointed optimizer, with its model, sample points, iteration counter and random
+            number generator states restored, ready to continue :code:`take_samples`. Neither the objective nor
+            the model fit are re-evaluated, unless the model could not be saved (in which case modeller is
+            re-run on X and Y).
+    """
+    with open(fname, 'rb') as f:
+        opt = pickle.load(f)
+    opt.objective_func = objective_func
+    opt.modeller = modeller
+    opt.journal = journal
+    opt.logger = logger
+    
+    np_state, py_state = opt.__dict__.pop('random_states')
+    np.random.set_state(np_state)
+    random.setstate(py_state)
+    
+    model = opt.__dict__.pop('model', None)
+    if model is None:
+        opt.pred_y, opt.pred_err = modeller(opt.X, opt.Y)
+    else:
+        pred_name, err_name = opt.__dict__.pop('model_methods')
+        opt.pred_y, opt.pred_err = getattr(model, pred_name), getattr(model, err_name)
+    return opt
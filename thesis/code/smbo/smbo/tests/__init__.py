@@ -1,6 +1,9 @@
 import test
 import dace
 import test_funcs
+import samplers
+import trust_regions
+import checkpoint
 #import plot
 
 import smb_opt
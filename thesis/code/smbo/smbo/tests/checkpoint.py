@@ -0,0 +1,50 @@
+"""
+.. module:: tests.checkpoint
+   :platform: Unix, Windows
+   :synopsis: tests that smb_optimizer.checkpoint and smb_optimizer.resume round-trip an optimization
+
+.. moduleauthor:: Drew Blount <dblount@reed.edu>
+
+"""
+
+from ..models    import dace_function
+from ..smb_optimizer  import smb_optimizer, resume
+from .test_funcs import branin, branin_domain
+
+from smbo import np
+import os
+import shutil
+import tempfile
+
+def main_test(iters = 2):
+    """
+    Args:
+        iters(int): the number of iterations run before the checkpoint is written
+    Checkpoints a trust-region optimization of the branin function, resumes it, and checks that the resumed
+    optimizer matches the original and continues exactly as it does
+    """
+    directory = tempfile.mkdtemp()
+    fname = os.path.join(directory, 'checkpoint.pkl')
+    try:
+        np.random.seed(0)
+        test = smb_optimizer(branin_domain(), branin, dace_function, trust_regions=2)
+        test.take_samples(0.0, iters, verbose=False, checkpoint=fname)
+        resumed = resume(fname, branin, dace_function)
+        points = np.array([[0.0, 5.0], [3.0, 2.0], [-2.0, 12.0]])
+        
+        print('Testing checkpoint and resume:')
+        print('    the samples are restored: '+str(np.array_equal(resumed.X, test.X) and np.array_equal(resumed.Y, test.Y)))
+        print('    the iteration counter is restored: '+str(resumed.iteration == test.iteration))
+        print('    the model predicts as before: '+str(np.allclose([resumed.pred_y(x) for x in points], [test.pred_y(x) for x in points])))
+        print('    the modelled region is still one of the trust regions: '+str(any(resumed.model_region is region for region in resumed.trust_regions)))
+        print('    and the one they are centered on: '+str(np.array_equal(resumed.model_region.center, test.model_region.center)))
+        
+        # resume restored the random state of the checkpoint, which was the last thing the original did, so from
+        # that same state both take the same next samples
+        state = np.random.get_state()
+        test.take_samples(0.0, 1, verbose=False)
+        np.random.set_state(state)
+        resumed.take_samples(0.0, 1, verbose=False)
+        print('    the resumed optimization continues as the original does: '+str(np.array_equal(resumed.X, test.X)))
+    finally:
+        shutil.rmtree(directory)
@@ -8,8 +8,12 @@
 """
 
 from ..models    import dace, dace_function
+from ..lazyprop  import reset_lps
 from ..samplers  import latin_hypercube
-from .test_funcs import sinusoparaboloid
+from ..smb_optimizer import smb_optimizer
+from .test_funcs import sinusoparaboloid, branin, branin_domain
+
+from smbo import np
 
 def main_test(ndims = 3):
     """
@@ -43,5 +47,122 @@ def check_memory(X,Y,pred_func,eps=1e-6):
     for i in range(len(X)):
         if abs(pred_func(X[i])-Y[i]) > eps:
             return False
-    return True    
-    
\ No newline at end of file
+    return True
+    
+def likelihood_grad_test(m = 15):
+    """
+    Args:
+        m(int): the number of branin samples the model is built on
+    Checks the analytic gradient of the log-likelihood with respect to P and Q (and the nugget, when it is fitted)
+    against central finite differences, for each kind of nugget
+    """
+    X = latin_hypercube(m, 2, branin_domain(), seed=0)
+    Y = [branin(x) for x in X]
+    z = np.array([1.6, 1.8, 0.05, 0.03])
+    
+    print('Testing the gradient of the DACE log-likelihood:')
+    for nugget in ('adaptive', 1e-6, 'fit'):
+        model = dace(X, Y, P=z[:2], Q=z[2:], fit=False, nugget=nugget)
+        def log_conc(z):
+            return model.log_conc_likelihood(z[:2], z[2:])
+        fd = finite_differences(log_conc, z)
+        log_conc(z)
+        print('    with a nugget of '+str(nugget)+', it matches finite differences in P and Q: '+str(np.allclose(model.log_conc_likelihood_grad(), fd, rtol=1e-4, atol=1e-6)))
+    
+    # the nugget's partial, at the fitted nugget's starting value
+    def log_conc_delta(delta):
+        model.delta = delta[0]
+        reset_lps(model, 'delta')
+        return model.log_conc_likelihood()
+    fd = finite_differences(log_conc_delta, np.array([model.delta]), h=1e-9)
+    log_conc_delta([1e-6])
+    print('    and in the nugget: '+str(np.allclose(model.log_conc_likelihood_nugget_grad(), fd, rtol=1e-4)))
+    
+    
+def prediction_grad_test(m = 15):
+    """
+    Args:
+        m(int): the number of branin samples the model is built on
+    Checks the analytic gradients of the prediction, its error and the expected improvement with respect to the
+    input point against central finite differences, at a few points away from the samples
+    """
+    X = latin_hypercube(m, 2, branin_domain(), seed=0)
+    points = latin_hypercube(5, 2, branin_domain(), seed=1)
+    model = dace(X, [branin(x) for x in X], P=[1.6, 1.8], Q=[0.05, 0.03], fit=False)
+    optimizer = smb_optimizer(branin_domain(), branin, lambda X, Y: dace_function(X, Y, P=model.P, Q=model.Q, fit=False), init_sampler=lambda: X)
+    
+    matches = {'y': True, 'err': True, 'ei': True}
+    for x in points:
+        y, err, y_grad, err_grad = model.pred_stats_grad(x)
+        matches['y'] &= np.allclose(y_grad, finite_differences(lambda x: model.pred_stats(x)[0], x), rtol=1e-4, atol=1e-6)
+        matches['err'] &= np.allclose(err_grad, finite_differences(lambda x: model.pred_stats(x)[1], x), rtol=1e-4, atol=1e-6)
+        ei, ei_grad = optimizer.exp_improvement_grad(x)
+        matches['ei'] &= np.allclose(ei_grad, finite_differences(optimizer.exp_improvement, x), rtol=1e-4, atol=1e-6)
+    
+    print('Testing the gradients of the DACE prediction:')
+    print('    the gradient of the prediction matches finite differences: '+str(matches['y']))
+    print('    and of its error matches finite differences: '+str(matches['err']))
+    print('    and of the expected improvement matches finite differences: '+str(matches['ei']))
+    
+    
+def update_test(m = 15):
+    """
+    Args:
+        m(int): the number of branin samples the model starts with
+    Adds points to a model one at a time with :meth:`dace.update`, and checks it against a model built afresh on the
+    extended data: first two points whose factor is extended by a row, then a near-copy of a sample point, for which
+    the factor is recomputed with a larger adaptive nugget
+    """
+    X = latin_hypercube(m + 2, 2, branin_domain(), seed=0)
+    Y = [branin(x) for x in X]
+    P, Q = [1.6, 1.8], [0.05, 0.03]
+    points = latin_hypercube(5, 2, branin_domain(), seed=1)
+    model = dace(X[:m], Y[:m], P=P, Q=Q, fit=False)
+    model.predict(points[0])
+    
+    print('Testing updates of the DACE model:')
+    extended = True
+    for i in range(m, m + 2):
+        model.update(X[i], Y[i])
+        extended &= hasattr(model, '_lazy_R_chol')
+        print('    after '+str(i - m + 1)+' update(s), it matches a model built afresh: '+str(check_same(model, dace(X[:i+1], Y[:i+1], P=P, Q=Q, fit=False), points)))
+    print('    and the factor of R was extended rather than recomputed: '+str(extended))
+    
+    x_copy = X[0] + 1e-9
+    model.update(x_copy, branin(x_copy))
+    fresh = dace(np.vstack((X, [x_copy])), Y + [branin(x_copy)], P=P, Q=Q, fit=False)
+    print('    after adding a near-copy of a sample point, it matches a model built afresh: '+str(check_same(model, fresh, points)))
+    print('    with the same nugget, above zero: '+str(model.delta == fresh.delta and model.delta > 0))
+    
+    
+def check_same(model, fresh, points):
+    """
+    Args:
+        model (dace), fresh (dace): models of the same data with the same P and Q
+        points (np.array): points from the domain
+    Returns:
+        bool: whether the models agree (to rounding) in the factor of R, the pairwise distances and the predictions at points
+    """
+    return (np.allclose(model.R_chol, fresh.R_chol, atol=1e-8)
+            and np.array_equal(model.diffs, fresh.diffs)
+            and np.allclose(model.predict_many(points), fresh.predict_many(points), atol=1e-6)
+            and np.allclose(model.pred_err_many(points), fresh.pred_err_many(points), atol=1e-6))
+    
+    
+def finite_differences(f, z, h=1e-6):
+    """
+    Args:
+        f (func): a function of a vector
+        z (np.array): the point its gradient is approximated at
+        h (float): the step, relative to each coordinate's magnitude (where that is above 1)
+    Returns:
+        np.array: the central finite-difference approximation of the gradient of f at z
+    """
+    grad = np.empty(len(z))
+    for i in range(len(z)):
+        step = h * max(1.0, abs(z[i]))
+        up, down = np.array(z, dtype=float), np.array(z, dtype=float)
+        up[i] += step
+        down[i] -= step
+        grad[i] = (f(up) - f(down)) / (2 * step)
+    return grad
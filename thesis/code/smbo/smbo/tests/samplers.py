@@ -0,0 +1,61 @@
+"""
+.. module:: tests.samplers
+   :platform: Unix, Windows
+   :synopsis: tests the initial-sample generators defined in smbo.samplers
+
+.. moduleauthor:: Drew Blount <dblount@reed.edu>
+
+"""
+
+from ..samplers  import halton, latin_hypercube, maximin_latin_hypercube, sobol
+from .test_funcs import branin_domain
+
+def main_test(m = 20):
+    """
+    Args:
+        m(int): the number of sample points to be drawn.
+    """
+    bounds = branin_domain()
+    X = latin_hypercube(m, len(bounds), bounds, seed=0)
+    
+    print('Testing the samplers module:')
+    print('    X = '+str(X))
+    print('    X is a latin hypercube over '+str(bounds)+': ' +str(check_latin(X, bounds)))
+    print('    the same seed gives the same sample: '+str((X == latin_hypercube(m, len(bounds), bounds, seed=0)).all()))
+    
+    maximin = maximin_latin_hypercube(m, len(bounds), bounds, seed=0)
+    print('    the maximin sample is a latin hypercube: '+str(check_latin(maximin, bounds)))
+    print('    and spreads its points further apart: '+str(min_dist(maximin) > min_dist(X)))
+    print('    the first 2^n sobol points are stratified: '+str(check_latin(sobol(2**5, len(bounds), bounds, seed=0), bounds)))
+    print('    the halton sample lies in the domain: '+str(check_bounds(halton(m, len(bounds), bounds, seed=0), bounds)))
+    
+    
+def check_latin(X, bounds):
+    """
+    Args:
+        X (np.array): an :math:`(m,k)` array of sample points
+        bounds (list): the :math:`k` min-max tuples of the domain
+    Returns:
+        bool: the truth value of the statement, "in every dimension, each of the :math:`m` equal-width bins of the domain holds exactly one sample point"
+    """
+    m = len(X)
+    for dim in range(len(bounds)):
+        lo, hi = bounds[dim]
+        bins = [int((x[dim] - lo) * m / float(hi - lo)) for x in X]
+        if sorted(bins) != list(range(m)):
+            return False
+    return True
+    
+def check_bounds(X, bounds):
+    """
+    Returns:
+        bool: whether every point of X lies in the bound-rectangle
+    """
+    return all(bounds[dim][0] <= x[dim] <= bounds[dim][1] for x in X for dim in range(len(bounds)))
+    
+def min_dist(X):
+    """
+    Returns:
+        float: the smallest distance between two points of X
+    """
+    return min(sum((a - b)**2 for a, b in zip(X[i], X[j]))**0.5 for i in range(len(X)) for j in range(i))
@@ -0,0 +1,27 @@
+"""
+.. module:: tests.trust_regions
+   :platform: Unix, Windows
+   :synopsis: tests the trust_region class of smbo.trust_region
+
+.. moduleauthor:: Drew Blount <dblount@reed.edu>
+
+"""
+
+from ..trust_region import trust_region
+from .test_funcs import branin, branin_domain
+
+def main_test():
+    """
+    Records a few batches in a fresh region over the branin domain and checks how it counts them
+    """
+    bounds = branin_domain()
+    region = trust_region(len(bounds), [2.5, 7.5])
+    center = [3.0, 3.0]
+    region.record([center], [branin(center)])
+    
+    print('Testing the trust_region module:')
+    print('    a fresh region counts its first batch as a success: '+str(region.successes == 1 and region.failures == 0))
+    print('    and recenters on it: '+str(list(region.center) == center and region.best == branin(center)))
+    region.record([[9.0, 14.0]], [branin([9.0, 14.0])])
+    print('    a worse batch counts as a failure: '+str(region.successes == 0 and region.failures == 1))
+    print('    and leaves the center where it was: '+str(list(region.center) == center))
@@ -0,0 +1,91 @@
+"""
+.. module:: trust_region
+   :platform: Unix, Windows
+   :synopsis: The state of one adaptive trust region: a hyperrectangle around the best point found in it,
+       which grows after repeated successes and shrinks after repeated failures (as in TuRBO, Eriksson et
+       al. 2019). An :class:`smbo.smb_optimizer.smb_optimizer` in trust-region mode models and searches
+       only inside its regions.
+
+.. moduleauthor:: Drew Blount <dblount@reed.edu>
+
+"""
+
+from smbo import np
+
+
+class trust_region:
+    """
+    A hyperrectangle of the input domain centered on the best sample found in it, with side lengths a
+    fraction :code:`length` of the domain's
+    """
+
+    def __init__(self, k, center, best=np.inf, length=0.8, min_length=0.5**7, max_length=1.6, success_tol=3, failure_tol=None):
+        """
+        Args:
+            k (int): the dimension of input space
+            center (list): the :math:`k`-vector the region is centered on
+            best (float): the objective value at center (inf if it has not been evaluated)
+            length (float): the side length of the region, as a fraction of each side of the domain
+            min_length (float): the length below which the region has collapsed, and should be restarted
+            max_length (float): the largest length the region may grow to
+            success_tol (int): the number of successive improving batches after which the region doubles
+            failure_tol (int): the number of successive non-improving samples after which the region halves;
+                defaults to :math:`\\max(4,k)`
+        """
+        self.center = np.asarray(center, dtype=float)
+        self.best = best
+        self.length = length
+        self.min_length = min_length
+        self.max_length = max_length
+        self.success_tol = success_tol
+        self.failure_tol = failure_tol or max(4, k)
+        self.successes = 0
+        self.failures = 0
+
+    def bounds(self, domain):
+        """
+        Args:
+            domain (list): the :math:`k` (min,max) tuples of the input domain
+        Returns:
+            list: the :math:`k` (min,max) tuples of the region, clipped to the domain
+        """
+        lower, upper = np.array(domain, dtype=float).T
+        half = self.length * (upper - lower) / 2.0
+        return list(zip(np.maximum(self.center - half, lower), np.minimum(self.center + half, upper)))
+
+    def record(self, X_new, Y_new):
+        """
+        Args:
+            X_new (np.array): points sampled in this region
+            Y_new (list): their objective values
+        Recenters the region on the best of them if it improves on the region's best, and counts the batch
+        as a success (if it improves by a relative :math:`10^{-3}`, or is the region's first) or as len(Y_new) failures, resizing the
+        region once either count reaches its tolerance.
+        """
+        i = int(np.argmin(Y_new))
+        # a fresh region (best = inf) improves on its first batch, whatever it holds
+        improved = not np.isfinite(self.best) or Y_new[i] < self.best - 1e-3 * abs(self.best)
+        if Y_new[i] < self.best:
+            self.center = np.asarray(X_new[i], dtype=float)
+            self.best = float(Y_new[i])
+
+        if improved:
+            self.successes += 1
+            self.failures = 0
+        else:
+            self.successes = 0
+            self.failures += len(Y_new)
+
+        if self.successes >= self.success_tol:
+            self.length = min(2.0 * self.length, self.max_length)
+            self.successes = 0
+        elif self.failures >= self.failure_tol:
+            self.length /= 2.0
+            self.failures = 0
+
+    @property
+    def collapsed(self):
+        """
+        bool: whether the region has shrunk below its minimum length
+        """
+        return self.length < self.min_length